@@ -3,7 +3,9 @@ from django.views.generic.base import TemplateView
 
 class AboutAuthorView(TemplateView):
     template_name = 'about/author.html'
+    query_budget = 2
 
 
 class AboutTechView(TemplateView):
     template_name = 'about/tech.html'
+    query_budget = 2
@@ -0,0 +1,365 @@
+import hashlib
+import math
+import random
+import threading
+import time
+import uuid
+from functools import wraps
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from .holes import fill_holes
+
+TAG_KEY = 'cache-tag:{}'
+PAGE_KEY = 'page:{}'
+LEASE_KEY = 'lease:{}'
+
+# как часто ждущий запрос проверяет, не пересчитана ли страница
+LEASE_POLL_INTERVAL = 0.05
+
+# маркер промаха, чтобы отличать его от закэшированного None
+MISSING = object()
+
+
+def tag_key(tag: str) -> str:
+    return TAG_KEY.format(tag)
+
+
+def get_tag_versions(tags: Iterable[str]) -> Dict[str, str]:
+    """Текущие версии тегов; отсутствующим тегам назначается новая."""
+    keys = {tag_key(tag): tag for tag in tags}
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        cache.add(key, uuid.uuid4().hex, None)
+        versions[key] = cache.get(key)
+    return versions
+
+
+def invalidate_tags(*tags: str) -> None:
+    """Сбрасывает все записи, помеченные хотя бы одним из тегов."""
+    cache.delete_many([tag_key(tag) for tag in tags])
+
+
+def read_entry(key: str) -> Tuple[object, bool, bool]:
+    """Значение, совпадают ли версии его тегов и истек ли срок.
+
+    Срок истекает с учетом вероятностного раннего истечения: чем ближе
+    срок и чем дольше считалось значение, тем вероятнее, что один из
+    запросов пересчитает его заранее, и записи не истекают у всех разом.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        return MISSING, False, True
+    versions, value, expires_at, delta = entry
+    if cache.get_many(versions.keys()) != versions:
+        return value, False, True
+    beta = settings.PAGE_CACHE_EARLY_BETA
+    early = delta * beta * -math.log(1 - random.random())
+    return value, True, time.time() + early >= expires_at
+
+
+def read_tagged(key: str) -> Tuple[object, bool]:
+    """Значение и признак его свежести; MISSING, если записи нет."""
+    value, valid, expired = read_entry(key)
+    return value, valid and not expired
+
+
+def get_tagged(key: str, default=None):
+    value, fresh = read_tagged(key)
+    return value if fresh else default
+
+
+def set_tagged(key: str, value, versions: Dict[str, str], timeout=None,
+               delta: float = 0.0, stale_timeout: int = 0):
+    """Кладет значение вместе с версиями тегов на момент его расчета.
+
+    Версии нужно получить до расчета значения: если тег сбросят, пока
+    значение считается, запись сразу окажется устаревшей. delta - время
+    расчета в секундах, от него зависит раннее истечение; stale_timeout -
+    сколько еще хранить запись после срока.
+    """
+    expires_at = time.time() + timeout if timeout else math.inf
+    cache.set(
+        key,
+        (versions, value, expires_at, delta),
+        timeout and timeout + stale_timeout
+    )
+
+
+def acquire_lease(key: str) -> Optional[str]:
+    """Право пересчитать запись; None, если ее уже пересчитывают."""
+    if not settings.PAGE_CACHE_LEASE_TIMEOUT:
+        return uuid.uuid4().hex
+    token = uuid.uuid4().hex
+    if cache.add(
+        LEASE_KEY.format(key), token, settings.PAGE_CACHE_LEASE_TIMEOUT
+    ):
+        return token
+    return None
+
+
+def release_lease(key: str, token: str) -> None:
+    lease_key = LEASE_KEY.format(key)
+    if cache.get(lease_key) == token:
+        cache.delete(lease_key)
+
+
+def wait_tagged(key: str):
+    """Ждет, пока другой запрос пересчитает запись."""
+    deadline = time.monotonic() + settings.PAGE_CACHE_LEASE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LEASE_POLL_INTERVAL)
+        value, fresh = read_tagged(key)
+        if fresh:
+            return value
+    return MISSING
+
+
+def tag_request(request: HttpRequest, *tags: str) -> None:
+    """Помечает кэшируемую страницу тегами.
+
+    Вызывается во view до запросов к данным страницы.
+    """
+    versions = getattr(request, '_cache_tag_versions', {})
+    versions.update(get_tag_versions(tags))
+    request._cache_tag_versions = versions
+
+
+def page_cache_key(request: HttpRequest) -> str:
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return PAGE_KEY.format(path)
+
+
+def page_etag(key: str, versions: Dict[str, str]) -> str:
+    """Версия страницы: меняется вместе с версиями ее тегов."""
+    state = key + ''.join(sorted(versions.values()))
+    return quote_etag(hashlib.md5(state.encode()).hexdigest())
+
+
+def conditional_page(request: HttpRequest,
+                     response: HttpResponse) -> HttpResponse:
+    """304 вместо страницы, если у клиента та же ее версия."""
+    last_modified = response.get('Last-Modified')
+    return get_conditional_response(
+        request,
+        etag=response.get('ETag'),
+        last_modified=last_modified and parse_http_date_safe(last_modified),
+        response=response
+    )
+
+
+def render_tagged(view, request: HttpRequest, args, kwargs, key: str,
+                  timeout: int, stale_timeout: int = 0) -> HttpResponse:
+    """Вызывает view и кладет страницу в кэш, если она помечена тегами.
+
+    Закэшированная страница несет ETag и Last-Modified, по которым
+    следующие запросы получают 304 без обращения к шаблонам.
+    """
+    started = time.monotonic()
+    response = view(request, *args, **kwargs)
+    versions = getattr(request, '_cache_tag_versions', None)
+    if response.status_code == 200 and versions:
+        response['ETag'] = page_etag(key, versions)
+        response['Last-Modified'] = http_date()
+        # персональные фрагменты отличаются у пользователей, а
+        # страница проверяется при каждом обращении
+        patch_cache_control(response, private=True, no_cache=True)
+        set_tagged(
+            key,
+            response,
+            versions,
+            timeout,
+            time.monotonic() - started,
+            stale_timeout
+        )
+    return response
+
+
+def fill_tagged(view, request: HttpRequest, args, kwargs, key: str,
+                cached, timeout: int, stale_timeout: int = 0) -> HttpResponse:
+    """Пересчитывает устаревшую страницу.
+
+    Страницу пересчитывает один запрос, остальные отдают устаревшую
+    копию cached или недолго ждут свежую.
+    """
+    token = acquire_lease(key)
+    if token is None:
+        if cached is not MISSING:
+            return cached
+        cached = wait_tagged(key)
+        if cached is not MISSING:
+            return cached
+
+    try:
+        return render_tagged(
+            view, request, args, kwargs, key, timeout, stale_timeout
+        )
+    finally:
+        if token is not None:
+            release_lease(key, token)
+
+
+def cacheable_request(request: HttpRequest) -> bool:
+    return request.method in ('GET', 'HEAD')
+
+
+def personalize(request: HttpRequest,
+                skeleton: HttpResponse) -> HttpResponse:
+    """Заполняет персональные фрагменты общей для всех страницы.
+
+    ETag дополняется пользователем, и 304 проверяется до отрисовки
+    фрагментов; закэшированный ответ не меняется.
+    """
+    response = HttpResponse(status=skeleton.status_code)
+    for header, value in skeleton.items():
+        response[header] = value
+    etag = skeleton.get('ETag')
+    if etag:
+        state = f'{etag}:{request.user.pk or "anon"}'
+        response['ETag'] = quote_etag(
+            hashlib.md5(state.encode()).hexdigest()
+        )
+    not_modified = conditional_page(request, response)
+    if not_modified is not response:
+        return not_modified
+    response.content = fill_holes(request, skeleton.content)
+    return response
+
+
+def cache_page_tagged(timeout: Optional[int] = None):
+    """Замена cache_page, которая сбрасывается по тегам страницы.
+
+    Страница кэшируется одна для всех пользователей, персональные
+    фрагменты вырезаются тегом hole и дорисовываются к каждому ответу
+    (см. core.holes). Устаревшую страницу пересчитывает только один
+    запрос, см. fill_tagged.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request: HttpRequest, *args, **kwargs) -> HttpResponse:
+            if not cacheable_request(request):
+                return view(request, *args, **kwargs)
+
+            request.page_skeleton = True
+
+            key = page_cache_key(request)
+            cached, fresh = read_tagged(key)
+            if not fresh:
+                cached = fill_tagged(
+                    view,
+                    request,
+                    args,
+                    kwargs,
+                    key,
+                    cached,
+                    timeout or settings.PAGE_CACHE_TIMEOUT
+                )
+            return personalize(request, cached)
+        return wrapper
+    return decorator
+
+
+# адрес запроса; остальные заголовки и cookies в поток не передаются
+DETACHED_META = (
+    'QUERY_STRING', 'SERVER_NAME', 'SERVER_PORT', 'HTTP_HOST',
+    'wsgi.url_scheme',
+)
+
+
+class DetachedRequest(HttpRequest):
+    """Запрос без WSGI-окружения, схема берется из скопированного META."""
+
+    def _get_scheme(self) -> str:
+        return self.META.get('wsgi.url_scheme', 'http')
+
+
+def detached_request(request: HttpRequest) -> HttpRequest:
+    """Копия запроса для фонового пересчета общей страницы.
+
+    Исходный запрос продолжает обрабатываться и уходит обратно серверу,
+    поэтому поток получает свой: только адрес, хост и анонимный
+    пользователь - от пользователя в общей странице ничего нет.
+    """
+    detached = DetachedRequest()
+    detached.method = 'GET'
+    detached.path = request.path
+    detached.path_info = request.path_info
+    detached.GET = request.GET.copy()
+    meta = list(DETACHED_META)
+    if settings.SECURE_PROXY_SSL_HEADER:
+        meta.append(settings.SECURE_PROXY_SSL_HEADER[0])
+    detached.META = {
+        name: request.META[name] for name in meta if name in request.META
+    }
+    detached.resolver_match = request.resolver_match
+    detached.user = AnonymousUser()
+    detached.page_skeleton = True
+    return detached
+
+
+def refresh_tagged(view, request: HttpRequest, args, kwargs, key: str,
+                   token: str, timeout: int, stale_timeout: int) -> None:
+    """Пересчитывает страницу в фоновом потоке.
+
+    request - отдельный запрос из detached_request.
+    """
+    try:
+        render_tagged(
+            view, request, args, kwargs, key, timeout, stale_timeout
+        )
+    finally:
+        release_lease(key, token)
+        # поток открывает свои соединения с БД, их нужно закрыть
+        connections.close_all()
+
+
+def cache_page_swr(timeout: Optional[int] = None,
+                   stale_timeout: Optional[int] = None):
+    """cache_page_tagged, отдающий страницу после срока timeout.
+
+    Пока не прошло еще stale_timeout секунд, отдается закэшированная
+    страница, а один фоновый поток ее пересчитывает. Позже, как и после
+    сброса тегов, запрос ждет пересчета страницы.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request: HttpRequest, *args, **kwargs) -> HttpResponse:
+            if not cacheable_request(request):
+                return view(request, *args, **kwargs)
+
+            request.page_skeleton = True
+
+            soft_timeout = timeout or settings.PAGE_CACHE_TIMEOUT
+            stale = stale_timeout or settings.PAGE_CACHE_STALE_TIMEOUT
+            key = page_cache_key(request)
+            cached, valid, expired = read_entry(key)
+            if valid and expired:
+                token = acquire_lease(key)
+                if token is not None:
+                    threading.Thread(
+                        target=refresh_tagged,
+                        args=(view, detached_request(request), args,
+                              kwargs, key, token, soft_timeout, stale),
+                        daemon=True
+                    ).start()
+            if not valid:
+                cached = fill_tagged(
+                    view,
+                    request,
+                    args,
+                    kwargs,
+                    key,
+                    cached,
+                    soft_timeout,
+                    stale
+                )
+            return personalize(request, cached)
+        return wrapper
+    return decorator
@@ -0,0 +1,314 @@
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.signals import request_started
+
+# журнал записей: номер последней записи, поколение журнала и ключи,
+# измененные каждой записью
+LOG_SEQ_KEY = 'l1-log:seq'
+LOG_ID_KEY = 'l1-log:id'
+LOG_KEY = 'l1-log:{}'
+
+# маркер промаха, чтобы отличать его от закэшированного None
+MISSING = object()
+
+
+class LocalStore:
+    """LRU-кэш процесса, общий для всех потоков воркера."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        # key -> (pickled value, expires_at); значения хранятся
+        # сериализованными, как в LocMemCache, чтобы вызывающий код не
+        # менял общий для потоков объект
+        self.data = OrderedDict()
+        # прочитанная часть журнала записей
+        self.log_id = None
+        self.log_seq = 0
+        self.last_sync = float('-inf')
+        self.stats = dict.fromkeys(
+            ('l1_hits', 'l1_misses', 'l2_hits', 'l2_misses'), 0
+        )
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                self.data.pop(key, None)
+                self.stats['l1_misses'] += 1
+                return MISSING
+            self.data.move_to_end(key)
+            self.stats['l1_hits'] += 1
+            pickled = entry[0]
+        return pickle.loads(pickled)
+
+    def set(self, key: str, value, timeout: float) -> None:
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.data[key] = (pickled, time.monotonic() + timeout)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+    def delete_many(self, keys) -> None:
+        with self.lock:
+            for key in keys:
+                self.data.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.data.clear()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(name: str, max_entries: int) -> LocalStore:
+    with _stores_lock:
+        if name not in _stores:
+            _stores[name] = LocalStore(max_entries)
+        return _stores[name]
+
+
+def request_sync(**kwargs) -> None:
+    # в начале запроса каждый воркер читает новые записи журнала
+    with _stores_lock:
+        for store in _stores.values():
+            store.last_sync = float('-inf')
+
+
+request_started.connect(request_sync)
+
+
+class TwoTierCache(BaseCache):
+    """Кэш процесса (L1) перед общим кэшем (L2).
+
+    LOCATION - имя общего кэша из settings.CACHES (memcached, файлы или
+    LocMemCache как локальная замена). Каждая запись в L2 добавляет
+    в общий журнал список измененных ключей, и воркеры, читая журнал
+    (в начале каждого запроса и не реже SYNC_INTERVAL секунд),
+    выбрасывают из L1 только эти ключи. Если часть журнала уже истекла
+    или он начат заново, L1 сбрасывается целиком.
+
+    Ключи с префиксами из L1_EXCLUDE (блокировки и другие короткие
+    ключи, которые чаще пишутся, чем читаются) в L1 не попадают и
+    в журнал не пишутся.
+
+    OPTIONS: L1_MAX_ENTRIES, L1_TIMEOUT, L1_EXCLUDE, SYNC_INTERVAL,
+    LOG_TIMEOUT, LOG_LIMIT - сколько записей журнала читать за раз,
+    и L1_NAME - имя хранилища L1, по умолчанию совпадает с LOCATION.
+
+    В L2 значение хранится вместе со временем истечения, и копия в L1
+    живет не дольше самого ключа: min(L1_TIMEOUT, остаток срока).
+    """
+
+    def __init__(self, location: str, params: dict):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = location
+        self._l1 = get_store(
+            options.get('L1_NAME', location),
+            options.get('L1_MAX_ENTRIES', 1000)
+        )
+        self._l1_timeout = options.get('L1_TIMEOUT', 60)
+        self._exclude = tuple(options.get(
+            'L1_EXCLUDE', ('lease:', 'blob-lock:', 'blob-pin:')
+        ))
+        self._sync_interval = options.get('SYNC_INTERVAL', 1.0)
+        self._log_timeout = options.get('LOG_TIMEOUT', 300)
+        self._log_limit = options.get('LOG_LIMIT', 1000)
+
+    @property
+    def shared(self) -> BaseCache:
+        return caches[self._shared_alias]
+
+    def get_stats(self) -> dict:
+        return dict(self._l1.stats)
+
+    def _local(self, key: str) -> bool:
+        return not key.startswith(self._exclude)
+
+    def _sync(self) -> None:
+        store = self._l1
+        if time.monotonic() - store.last_sync < self._sync_interval:
+            return
+        store.last_sync = time.monotonic()
+        state = self.shared.get_many([LOG_ID_KEY, LOG_SEQ_KEY])
+        log_id, seq = state.get(LOG_ID_KEY), state.get(LOG_SEQ_KEY, 0)
+        if log_id != store.log_id or seq < store.log_seq:
+            # журнал начат заново: неизвестно, что менялось до этого
+            store.clear()
+        elif seq > store.log_seq:
+            self._replay(store.log_seq + 1, seq)
+        store.log_id, store.log_seq = log_id, seq
+
+    def _replay(self, first: int, last: int) -> None:
+        store = self._l1
+        if last - first >= self._log_limit:
+            store.clear()
+            return
+        log_keys = [LOG_KEY.format(n) for n in range(first, last + 1)]
+        entries = self.shared.get_many(log_keys)
+        if len(entries) < len(log_keys):
+            # запись истекла или еще не дописана - ключи неизвестны
+            store.clear()
+            return
+        for keys in entries.values():
+            store.delete_many(keys)
+
+    def _invalidate(self, keys, version=None) -> None:
+        """Убирает ключи из своего L1 и записывает их в журнал.
+
+        Значение в L2 уже записано: воркер, прочитавший запись журнала,
+        прочитает из L2 новое значение.
+        """
+        keys = [
+            self.make_key(key, version) for key in keys if self._local(key)
+        ]
+        if not keys:
+            return
+        self._l1.delete_many(keys)
+        try:
+            seq = self.shared.incr(LOG_SEQ_KEY)
+        except ValueError:
+            # журнала нет или его вытеснили: новое поколение
+            self.shared.set(LOG_ID_KEY, uuid.uuid4().hex, None)
+            self.shared.add(LOG_SEQ_KEY, 0, None)
+            seq = self.shared.incr(LOG_SEQ_KEY)
+        self.shared.set(LOG_KEY.format(seq), keys, self._log_timeout)
+
+    def _timeout(self, timeout):
+        # срок нужен в секундах, чтобы записать время истечения рядом
+        # со значением, поэтому умолчание берется у общего кэша
+        if timeout is DEFAULT_TIMEOUT:
+            return self.shared.default_timeout
+        return timeout
+
+    def _entry(self, value, timeout) -> tuple:
+        expires_at = None if timeout is None else time.time() + timeout
+        return value, expires_at
+
+    def _remaining(self, expires_at):
+        return None if expires_at is None else expires_at - time.time()
+
+    def _remember(self, key: str, entry: tuple) -> None:
+        value, expires_at = entry
+        timeout = self._l1_timeout
+        remaining = self._remaining(expires_at)
+        if remaining is not None:
+            if remaining <= 0:
+                return
+            timeout = min(timeout, remaining)
+        self._l1.set(key, value, timeout)
+
+    def get(self, key, default=None, version=None):
+        self._sync()
+        local_key = self.make_key(key, version)
+        local = self._local(key)
+        if local:
+            value = self._l1.get(local_key)
+            if value is not MISSING:
+                return value
+        entry = self.shared.get(key, MISSING, version=version)
+        if entry is MISSING:
+            self._l1.stats['l2_misses'] += 1
+            return default
+        self._l1.stats['l2_hits'] += 1
+        if local:
+            self._remember(local_key, entry)
+        return entry[0]
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        found = {}
+        missing = []
+        for key in keys:
+            local_key = self.make_key(key, version)
+            value = MISSING
+            if self._local(key):
+                value = self._l1.get(local_key)
+            if value is MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            shared = self.shared.get_many(missing, version=version)
+            self._l1.stats['l2_hits'] += len(shared)
+            self._l1.stats['l2_misses'] += len(missing) - len(shared)
+            for key, entry in shared.items():
+                local_key = self.make_key(key, version)
+                if self._local(key):
+                    self._remember(local_key, entry)
+                found[key] = entry[0]
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        self.shared.set(
+            key, self._entry(value, timeout), timeout, version=version
+        )
+        self._invalidate([key], version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        added = self.shared.add(
+            key, self._entry(value, timeout), timeout, version=version
+        )
+        if added:
+            self._invalidate([key], version)
+        return added
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        failed = self.shared.set_many(
+            {key: self._entry(value, timeout) for key, value in data.items()},
+            timeout,
+            version=version
+        )
+        self._invalidate(data, version)
+        return failed
+
+    def delete(self, key, version=None):
+        self.shared.delete(key, version=version)
+        self._invalidate([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.shared.delete_many(keys, version=version)
+        self._invalidate(keys, version)
+
+    def incr(self, key, delta=1, version=None):
+        # значение в L2 лежит вместе со сроком, поэтому incr общего кэша
+        # не подходит; как и в BaseCache, операция не атомарна
+        entry = self.shared.get(key, version=version)
+        if entry is None:
+            raise ValueError("Key '%s' not found" % key)
+        value, expires_at = entry
+        value += delta
+        remaining = self._remaining(expires_at)
+        if remaining is not None and remaining <= 0:
+            raise ValueError("Key '%s' not found" % key)
+        self.shared.set(
+            key, (value, expires_at), remaining, version=version
+        )
+        self._invalidate([key], version)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        entry = self.shared.get(key, version=version)
+        if entry is None:
+            return False
+        self.set(key, entry[0], timeout, version=version)
+        return True
+
+    def clear(self):
+        self.shared.clear()
+        self._l1.clear()
+        self._l1.log_id, self._l1.log_seq = None, 0
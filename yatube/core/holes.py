@@ -0,0 +1,52 @@
+import base64
+import json
+import re
+from typing import Callable, Dict
+
+from django.http import HttpRequest
+from django.template.loader import render_to_string
+
+# пользовательский текст в шаблонах экранируется, поэтому метку в
+# страницу может вставить только тег hole
+HOLE = '<!--hole:{}-->'
+HOLE_RE = re.compile(rb'<!--hole:([\w=-]+)-->')
+
+_renderers: Dict[str, Callable[..., str]] = {}
+
+
+def register_hole(name: str):
+    """Регистрирует функцию, которая рисует персональный фрагмент."""
+    def decorator(renderer: Callable[..., str]):
+        _renderers[name] = renderer
+        return renderer
+    return decorator
+
+
+def render_hole(request: HttpRequest, name: str, **kwargs) -> str:
+    return _renderers[name](request, **kwargs)
+
+
+def hole(request: HttpRequest, name: str, **kwargs) -> str:
+    """Персональный фрагмент страницы.
+
+    При отрисовке общей для всех страницы (request.page_skeleton)
+    вместо фрагмента ставится метка, которую fill_holes заменяет для
+    каждого запроса. Аргументы фрагмента должны сериализоваться в JSON.
+    """
+    if getattr(request, 'page_skeleton', False):
+        payload = json.dumps([name, kwargs]).encode()
+        return HOLE.format(base64.urlsafe_b64encode(payload).decode())
+    return render_hole(request, name, **kwargs)
+
+
+def fill_holes(request: HttpRequest, content: bytes) -> bytes:
+    def replace(match) -> bytes:
+        name, kwargs = json.loads(base64.urlsafe_b64decode(match.group(1)))
+        return render_hole(request, name, **kwargs).encode()
+
+    return HOLE_RE.sub(replace, content)
+
+
+@register_hole('user_menu')
+def user_menu(request: HttpRequest) -> str:
+    return render_to_string('includes/user_menu.html', request=request)
@@ -0,0 +1,109 @@
+import logging
+import re
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+# IN (%s, %s, ...) разной длины - один и тот же запрос
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(limit: int):
+    """Сколько запросов к БД может сделать view.
+
+    Бюджет не должен зависеть от размера страницы: запрос на каждую
+    строку - это N+1. Декоратор ставится поверх остальных, для
+    class-based view можно задать атрибут класса query_budget.
+    """
+    def decorator(view: Callable) -> Callable:
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def get_budget(view: Callable) -> Optional[int]:
+    budget = getattr(view, 'query_budget', None)
+    if budget is None:
+        budget = getattr(getattr(view, 'view_class', None),
+                         'query_budget', None)
+    return budget
+
+
+class QueryLog:
+    """SQL, выполненный внутри record_queries, без параметров."""
+
+    def __init__(self):
+        self.queries: List[str] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    def duplicates(self) -> List[Tuple[str, int]]:
+        """Запросы, выполненные больше одного раза, с числом повторов."""
+        counts = Counter(IN_LIST_RE.sub('IN (...)', sql)
+                         for sql in self.queries)
+        return [(sql, count) for sql, count in counts.most_common()
+                if count > 1]
+
+    def report(self) -> str:
+        lines = [f'{len(self)} запросов к БД']
+        lines.extend(f'  {count} раз: {sql}'
+                     for sql, count in self.duplicates())
+        return '\n'.join(lines)
+
+
+@contextmanager
+def record_queries() -> Iterator[QueryLog]:
+    """Записывает запросы ко всем базам, в том числе без DEBUG."""
+    log = QueryLog()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(log))
+        yield log
+
+
+class QueryBudgetMiddleware:
+    """Сверяет число запросов view с его бюджетом.
+
+    QUERY_BUDGET_MODE: 'raise' - исключение (для тестов), 'warn' -
+    предупреждение в лог со списком повторяющихся запросов, 'off' -
+    middleware отключен.
+    """
+
+    def __init__(self, get_response):
+        self.mode = settings.QUERY_BUDGET_MODE
+        if self.mode == 'off':
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        with record_queries() as log:
+            response = self.get_response(request)
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None and len(log) > budget:
+            message = (
+                f'{request.method} {request.path}: бюджет {budget}, '
+                f'{log.report()}'
+            )
+            if self.mode == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_budget(view_func)
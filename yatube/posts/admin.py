@@ -1,6 +1,20 @@
-from django.contrib import admin
+from datetime import date
 
-from .models import Group, Post
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME, ActionForm
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models import F, Max, Min
+from django.template.defaultfilters import filesizeformat
+from django.template.response import TemplateResponse
+from django.utils import timezone
+
+from . import moderation
+from .models import Group, Post, User
+from .paginators import EstimatedCountPaginator
+from .search import match_expression, matching_posts, search_available
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -13,6 +27,100 @@ class GroupAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
 
+class PostAdminQuerySet(models.QuerySet):
+    """Границы дат для date_hierarchy по индексу post_pub_date_idx.
+
+    Без фильтров тег date_hierarchy считает MIN и MAX даты одним
+    запросом, а годы - через DISTINCT, и оба запроса проходят всю
+    таблицу. Здесь первый и последний пост ищутся по индексу, а годы
+    берутся все между ними.
+    """
+
+    def edge(self, field_name: str, last: bool = False):
+        order = f'-{field_name}' if last else field_name
+        return self.order_by(order).values_list(
+            field_name, flat=True
+        ).first()
+
+    def aggregate(self, *args, **kwargs):
+        edges = {Min: False, Max: True}
+        if args or self.query.where or not kwargs or any(
+            type(aggregate) not in edges
+            or aggregate.filter is not None
+            or not isinstance(aggregate.source_expressions[0], F)
+            for aggregate in kwargs.values()
+        ):
+            return super().aggregate(*args, **kwargs)
+        return {
+            alias: self.edge(
+                aggregate.source_expressions[0].name,
+                last=edges[type(aggregate)]
+            )
+            for alias, aggregate in kwargs.items()
+        }
+
+    def dates(self, field_name, kind, order='ASC'):
+        if kind != 'year' or self.query.where:
+            return super().dates(field_name, kind, order)
+        first = self.edge(field_name)
+        if first is None:
+            return []
+        last = self.edge(field_name, last=True)
+        years = [
+            date(year, 1, 1) for year in range(
+                timezone.localtime(first).year,
+                timezone.localtime(last).year + 1
+            )
+        ]
+        return years if order == 'ASC' else years[::-1]
+
+
+class JoinedAutocompleteSelect(AutocompleteSelect):
+    """AutocompleteSelect для строк списка.
+
+    Подпись выбранного значения берется у объекта, загруженного через
+    list_select_related, а не отдельным запросом на каждую строку.
+    """
+
+    selected = None
+
+    def optgroups(self, name, value, attr=None):
+        values = [str(v) for v in value if v not in (None, '')]
+        if self.selected is None or values != [str(self.selected[0])]:
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        pk, label = self.selected
+        options.append(
+            self.create_option(name, pk, label, True, len(options))
+        )
+        return [(None, options, 0)]
+
+
+class PostChangeListForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        field = self.fields.get('group')
+        if field is not None and self.instance.group_id is not None:
+            # виджет может быть обернут в RelatedFieldWidgetWrapper
+            widget = getattr(field.widget, 'widget', field.widget)
+            widget.selected = (
+                self.instance.group_id, str(self.instance.group)
+            )
+
+
+class PostActionForm(ActionForm):
+    group = forms.ModelChoiceField(
+        Group.objects.all(),
+        required=False,
+        label='Группа',
+        widget=AutocompleteSelect(
+            Post._meta.get_field('group').remote_field, admin.site
+        ),
+    )
+
+
 class PostAdmin(admin.ModelAdmin):
     list_display = (
         'pk',
@@ -20,11 +128,141 @@ class PostAdmin(admin.ModelAdmin):
         'pub_date',
         'author',
         'group',
+        'image_info',
     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    autocomplete_fields = ('author', 'group')
     search_fields = ('text', )
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
+    paginator = EstimatedCountPaginator
+    # "N из M всего" требует второго COUNT(*) по всей таблице
+    show_full_result_count = False
     empty_value_display = '-пусто-'
+    action_form = PostActionForm
+    actions = ('move_to_group', 'delete_posts', 'purge_authors')
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return PostAdminQuerySet(self.model, queryset.query, queryset.db)
+
+    def get_changelist_form(self, request, **kwargs):
+        kwargs.setdefault('form', PostChangeListForm)
+        return super().get_changelist_form(request, **kwargs)
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.get_autocomplete_fields(request):
+            kwargs.setdefault('widget', JoinedAutocompleteSelect(
+                db_field.remote_field, self.admin_site,
+                using=kwargs.get('using')
+            ))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def image_info(self, post: Post) -> str:
+        # из сохраненных метаданных, без чтения файла
+        if not post.image_width:
+            return self.empty_value_display
+        return (
+            f'{post.image_width}×{post.image_height} {post.image_format}, '
+            f'{filesizeformat(post.image_size)}'
+        )
+    image_info.short_description = 'Картинка'
+
+    def get_search_results(self, request, queryset, search_term):
+        # вместо LIKE '%...%' по всей таблице - индекс FTS5
+        if not search_term or not search_available():
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        if not match_expression(search_term):
+            return queryset.none(), False
+        return queryset.filter(pk__in=matching_posts(search_term)), False
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # стандартное удаление загружает каждый пост и его комментарии и
+        # шлет сигналы по одной строке - вместо него delete_posts
+        actions.pop('delete_selected', None)
+        return actions
+
+    def confirm(self, request, action: str, question: str):
+        """Страница подтверждения, None - если действие подтверждено."""
+        if request.POST.get('confirmed'):
+            return None
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Вы уверены?',
+            'opts': self.model._meta,
+            'question': question,
+            'action': action,
+            'selected': request.POST.getlist(ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'action_checkbox_name': ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(
+            request, 'admin/posts/post/confirm_moderation.html', context
+        )
+
+    def report(self, request, done: str,
+               report: moderation.ModerationReport) -> None:
+        self.message_user(
+            request,
+            f'{done}: постов {report.posts}, комментариев '
+            f'{report.comments}, пачек {report.batches}',
+            messages.SUCCESS
+        )
+
+    def move_to_group(self, request, queryset):
+        try:
+            group = PostActionForm.base_fields['group'].clean(
+                request.POST.get('group')
+            )
+        except ValidationError:
+            group = None
+        if group is None:
+            self.message_user(
+                request, 'Выберите группу для переноса', messages.WARNING
+            )
+            return None
+        self.report(
+            request, f'Перенесено в группу «{group}»',
+            moderation.move_posts(queryset, group)
+        )
+        return None
+    move_to_group.short_description = 'Перенести выбранные посты в группу'
+
+    def delete_posts(self, request, queryset):
+        response = self.confirm(
+            request, 'delete_posts',
+            f'Удалить выбранные посты ({queryset.count()}) вместе с '
+            f'комментариями?'
+        )
+        if response is not None:
+            return response
+        self.report(request, 'Удалено', moderation.delete_posts(queryset))
+        return None
+    delete_posts.short_description = 'Удалить выбранные посты'
+
+    def purge_authors(self, request, queryset):
+        authors = User.objects.filter(
+            pk__in=queryset.order_by().values('author_id')
+        ).order_by('pk')
+        response = self.confirm(
+            request, 'purge_authors',
+            'Удалить все посты и комментарии авторов: '
+            f'{", ".join(author.username for author in authors)}?'
+        )
+        if response is not None:
+            return response
+        report = moderation.ModerationReport()
+        for author in authors.iterator():
+            report += moderation.purge_user_content(author)
+        self.report(request, 'Удален контент авторов', report)
+        return None
+    purge_authors.short_description = (
+        'Удалить все посты и комментарии авторов выбранных постов'
+    )
 
 
 admin.site.register(Post, PostAdmin)
@@ -0,0 +1,62 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+
+
+def _bump(queryset, **deltas) -> int:
+    # F() выражения считаются в БД, поэтому параллельные запросы
+    # не затирают изменения друг друга; ниже нуля счетчик не уходит,
+    # даже если строки вставлялись в обход сигналов
+    return queryset.update(**{
+        field: F(field) + delta if delta > 0
+        else Greatest(F(field) + delta, Value(0))
+        for field, delta in deltas.items()
+    })
+
+
+def bump_author(user_id: int, **deltas) -> None:
+    stats = AuthorStats.objects.filter(user_id=user_id)
+    if _bump(stats, **deltas):
+        return
+    # строки статистики нет только у пользователей, созданных в обход
+    # сигналов; у удаляемого пользователя ее не создаем
+    if all(delta > 0 for delta in deltas.values()):
+        AuthorStats.objects.get_or_create(user_id=user_id)
+        _bump(stats, **deltas)
+
+
+def bump_group(group_id, delta: int) -> None:
+    if group_id is not None:
+        _bump(Group.objects.filter(pk=group_id), posts_count=delta)
+
+
+def bump_comments(post_id: int, delta: int) -> None:
+    _bump(Post.objects.filter(pk=post_id), comments_count=delta)
+
+
+def _count(queryset, field: str):
+    counts = (
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def rebuild_counters() -> None:
+    """Пересчитывает все счетчики с нуля."""
+    AuthorStats.objects.bulk_create(
+        [AuthorStats(user_id=pk) for pk in User.objects.filter(
+            stats__isnull=True).values_list('pk', flat=True)],
+        batch_size=500,
+    )
+    AuthorStats.objects.update(
+        posts_count=_count(Post.objects, 'author'),
+        followers_count=_count(Follow.objects, 'author'),
+        following_count=_count(Follow.objects, 'user'),
+    )
+    Group.objects.update(posts_count=_count(Post.objects, 'group'))
+    Post.objects.update(comments_count=_count(Comment.objects, 'post'))
@@ -0,0 +1,152 @@
+from itertools import islice
+from typing import Set, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import AuthorStats, FeedItem, Follow, Post, User
+from .paginators import (HybridFeedPaginator, MergeFeedPaginator,
+                         TimelinePaginator)
+
+FAN_OUT_BATCH_SIZE = 500
+
+FEED_MODE_PUSH = 'push'
+FEED_MODE_HYBRID = 'hybrid'
+FEED_MODE_MERGE = 'merge'
+
+CELEBRITIES_CACHE_KEY = 'feeds:celebrities'
+CELEBRITIES_CACHE_TIMEOUT = 300
+
+
+def is_hybrid_mode() -> bool:
+    return settings.FOLLOW_FEED_MODE == FEED_MODE_HYBRID
+
+
+def is_celebrity(author_id: int) -> bool:
+    """Проверяет, что подписчиков у автора не меньше порога."""
+    return AuthorStats.objects.filter(
+        user_id=author_id,
+        followers_count__gte=settings.FEED_CELEBRITY_THRESHOLD
+    ).exists()
+
+
+def get_celebrity_ids() -> Set[int]:
+    celebrity_ids = cache.get(CELEBRITIES_CACHE_KEY)
+    if celebrity_ids is None:
+        celebrity_ids = set(
+            AuthorStats.objects.filter(
+                followers_count__gte=settings.FEED_CELEBRITY_THRESHOLD
+            ).values_list('user_id', flat=True)
+        )
+        cache.set(
+            CELEBRITIES_CACHE_KEY, celebrity_ids, CELEBRITIES_CACHE_TIMEOUT
+        )
+    return celebrity_ids
+
+
+def _bulk_insert(items) -> None:
+    # вставляем пачками, чтобы не держать в памяти всех подписчиков
+    items = iter(items)
+    while True:
+        batch = list(islice(items, FAN_OUT_BATCH_SIZE))
+        if not batch:
+            return
+        FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out_post(post: Post) -> None:
+    """Раскладывает новый пост по лентам подписчиков автора.
+
+    В гибридном режиме посты популярных авторов не раскладываются,
+    а подмешиваются в ленту при чтении.
+    """
+    if is_hybrid_mode() and is_celebrity(post.author_id):
+        if post.author_id not in get_celebrity_ids():
+            # автор только что стал популярным - пересчитаем список
+            cache.delete(CELEBRITIES_CACHE_KEY)
+        return
+    followers = Follow.objects.filter(author_id=post.author_id).values_list(
+        'user_id', flat=True
+    )
+    _bulk_insert(
+        FeedItem(user_id=user_id, post_id=post.pk, pub_date=post.pub_date)
+        for user_id in followers.iterator()
+    )
+
+
+def backfill_feed(user_id: int, author_id: int) -> None:
+    """Добавляет в ленту посты автора, на которого подписался user."""
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'pub_date'
+    )
+    _bulk_insert(
+        FeedItem(user_id=user_id, post_id=pk, pub_date=pub_date)
+        for pk, pub_date in posts.iterator()
+    )
+
+
+def author_unfollowed(author_id: int) -> None:
+    """Раскладывает посты автора, переставшего быть популярным.
+
+    Пока автор был популярным, его посты подмешивались в ленту при
+    чтении и по лентам не раскладывались; без этого после потери статуса
+    они пропали бы из лент подписчиков. Вызывается после уменьшения
+    счетчика подписчиков: ровно порог минус один значит, что автор только
+    что опустился ниже порога.
+    """
+    if not is_hybrid_mode() or not AuthorStats.objects.filter(
+        user_id=author_id,
+        followers_count=settings.FEED_CELEBRITY_THRESHOLD - 1
+    ).exists():
+        return
+    posts = list(
+        Post.objects.filter(author_id=author_id).values_list('pk', 'pub_date')
+    )
+    followers = Follow.objects.filter(author_id=author_id).values_list(
+        'user_id', flat=True
+    )
+    _bulk_insert(
+        FeedItem(user_id=user_id, post_id=pk, pub_date=pub_date)
+        for user_id in followers.iterator()
+        for pk, pub_date in posts
+    )
+    # только теперь посты перестают подмешиваться при чтении
+    cache.delete(CELEBRITIES_CACHE_KEY)
+
+
+def prune_feed(user_id: int, author_id: int) -> None:
+    """Убирает из ленты посты автора после отписки."""
+    FeedItem.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def get_follow_feed(user: User) -> Tuple[object, type]:
+    """Возвращает источник ленты подписок и класс пагинатора для него."""
+    timeline = FeedItem.objects.filter(user=user).select_related(
+        'post__author', 'post__group'
+    )
+    if settings.FOLLOW_FEED_MODE == FEED_MODE_MERGE:
+        return get_merge_feed(user), MergeFeedPaginator
+    if not is_hybrid_mode():
+        return timeline, TimelinePaginator
+
+    celebrity_ids = get_celebrity_ids()
+    followed_celebrities = [
+        author_id
+        for author_id in user.follower.values_list('author_id', flat=True)
+        if author_id in celebrity_ids
+    ]
+    pulled = Post.objects.filter(
+        author_id__in=followed_celebrities
+    ).select_related('author', 'group')
+    return (timeline, pulled), HybridFeedPaginator
+
+
+def get_merge_feed(user: User) -> Tuple[list, object]:
+    """Источник ленты для слияния колец последних постов авторов."""
+    author_ids = list(user.follower.values_list('author_id', flat=True))
+    posts = Post.objects.filter(author_id__in=author_ids).select_related(
+        'author', 'group'
+    )
+    return author_ids, posts
@@ -0,0 +1,48 @@
+from django.http import HttpRequest
+from django.template.loader import render_to_string
+
+from core.holes import register_hole
+
+from .forms import CommentForm
+from .models import Follow
+
+
+@register_hole('switcher')
+def switcher(request: HttpRequest) -> str:
+    return render_to_string(
+        'posts/includes/switcher.html', request=request
+    )
+
+
+@register_hole('follow_button')
+def follow_button(request: HttpRequest, author_id: int,
+                  username: str) -> str:
+    following = request.user.is_authenticated and Follow.objects.filter(
+        user=request.user, author_id=author_id
+    ).exists()
+    return render_to_string(
+        'posts/includes/follow_button.html',
+        {'username': username, 'following': following},
+        request=request
+    )
+
+
+@register_hole('post_edit_link')
+def post_edit_link(request: HttpRequest, post_id: int,
+                   author_id: int) -> str:
+    if request.user.pk != author_id:
+        return ''
+    return render_to_string(
+        'posts/includes/post_edit_link.html', {'post_id': post_id}
+    )
+
+
+@register_hole('comment_form')
+def comment_form(request: HttpRequest, post_id: int) -> str:
+    if not request.user.is_authenticated:
+        return ''
+    return render_to_string(
+        'includes/comment_form.html',
+        {'form': CommentForm(), 'post_id': post_id},
+        request=request
+    )
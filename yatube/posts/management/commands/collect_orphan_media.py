@@ -0,0 +1,225 @@
+import json
+import posixpath
+from datetime import timedelta
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage, default_storage
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from posts.models import Post
+from posts.storage import blob_lock, is_pinned
+from posts.thumbnails import load_stored
+
+IMAGES_DIR = 'posts'
+# где остановился прошлый запуск с --max-batches
+PROGRESS_FILE = '.collect_orphan_media.json'
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки постов и миниатюры, на которые не ссылается '
+        'ни один пост, и сообщает, сколько места освобождено'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько файлов проверять одним запросом к БД'
+        )
+        parser.add_argument(
+            '--max-batches', type=int, default=0,
+            help='Остановиться после стольких пачек, 0 - без ограничения; '
+                 'следующий запуск продолжит с того же места'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Не трогать файлы моложе стольких секунд: их пост еще '
+                 'может быть не сохранен'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено'
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.batches = 0
+        self.removed = self.reclaimed = 0
+        self.cutoff = timezone.now() - timedelta(seconds=options['min_age'])
+        self.images = Post._meta.get_field('image').storage
+
+        # сначала миниатюры: kvstore.delete для картинки ниже удаляет
+        # оставшиеся миниатюры сам, и их размер не попал бы в отчет
+        passes = (
+            (
+                default.storage,
+                sorl_settings.THUMBNAIL_PREFIX.rstrip('/'),
+                self.stored_thumbnails,
+                self.remove
+            ),
+            (
+                self.images,
+                IMAGES_DIR,
+                self.referenced_images,
+                self.remove_image
+            ),
+        )
+        progress = self.load_progress()
+        roots = [root for _, root, _, _ in passes]
+        start = 0
+        if progress and progress[0] in roots:
+            start = roots.index(progress[0])
+        for storage, root, referenced, remove in passes[start:]:
+            after = progress[1] if progress and progress[0] == root else None
+            if not self.collect(storage, root, referenced, remove, after):
+                break
+        else:
+            # все каталоги пройдены - следующий запуск начнет сначала
+            self.save_progress(None)
+
+        action = 'Можно удалить' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {self.removed}, '
+            f'освобождено: {filesizeformat(self.reclaimed)}'
+        ))
+
+    def load_progress(self) -> Optional[Tuple[str, str]]:
+        """Каталог и последний проверенный файл прошлого запуска."""
+        try:
+            with default_storage.open(PROGRESS_FILE) as file:
+                progress = json.loads(file.read())
+        except (FileNotFoundError, ValueError):
+            return None
+        return progress['root'], progress['after']
+
+    def save_progress(self, progress: Optional[Tuple[str, str]]) -> None:
+        if self.options['dry_run']:
+            return
+        default_storage.delete(PROGRESS_FILE)
+        if progress is not None:
+            root, after = progress
+            default_storage.save(PROGRESS_FILE, ContentFile(
+                json.dumps({'root': root, 'after': after})
+            ))
+
+    def stored_thumbnails(self, names: List[str]) -> Set[str]:
+        """Миниатюры, записанные в хранилище sorl, - одним запросом.
+
+        Запись миниатюры удаляется вместе с записью картинки
+        (release_image), поэтому миниатюра без записи никому не нужна.
+        """
+        thumbnails = [ImageFile(name, default.storage) for name in names]
+        stored = load_stored(thumbnails)
+        return {
+            thumbnail.name for thumbnail in thumbnails
+            if thumbnail.key in stored
+        }
+
+    def referenced_images(self, names: List[str]) -> Set[str]:
+        return set(
+            Post.objects.filter(image__in=names).values_list(
+                'image', flat=True
+            )
+        )
+
+    def collect(self, storage: Storage, root: str, referenced, remove,
+                after: Optional[str] = None) -> bool:
+        """Удаляет пачками файлы из root, которых нет в referenced(names).
+
+        Обход начинается после файла after. False - если пачки
+        закончились раньше файлов; тогда место остановки сохраняется.
+        """
+        for names in self.chunks(self.walk(storage, root, after)):
+            if self.out_of_batches():
+                return False
+            self.batches += 1
+            keep = referenced(names)
+            for name in names:
+                if name not in keep:
+                    remove(storage, name)
+            self.save_progress((root, names[-1]))
+        return True
+
+    def out_of_batches(self) -> bool:
+        limit = self.options['max_batches']
+        return bool(limit) and self.batches >= limit
+
+    def chunks(self, names: Iterable[str]) -> Iterator[List[str]]:
+        chunk = []
+        for name in names:
+            chunk.append(name)
+            if len(chunk) >= self.options['batch_size']:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def walk(self, storage: Storage, root: str,
+             after: Optional[str] = None) -> Iterator[str]:
+        """Старые файлы каталога root и его подкаталогов.
+
+        Имена идут по возрастанию пути, поэтому обход можно продолжить
+        после файла after, не перечисляя пройденные каталоги.
+        """
+        position = ()
+        if after is not None:
+            position = tuple(posixpath.relpath(after, root).split('/'))
+        yield from self._walk(storage, root, position)
+
+    def _walk(self, storage: Storage, root: str,
+              position: tuple) -> Iterator[str]:
+        if not storage.exists(root):
+            return
+        directories, files = storage.listdir(root)
+        entries = sorted(
+            [(name, True) for name in directories]
+            + [(name, False) for name in files]
+        )
+        for entry, is_directory in entries:
+            if position and entry < position[0]:
+                continue
+            current = bool(position) and entry == position[0]
+            name = posixpath.join(root, entry)
+            if is_directory:
+                yield from self._walk(
+                    storage, name, position[1:] if current else ()
+                )
+                continue
+            if current:
+                continue
+            try:
+                # время изменения учитывает USE_TZ, как и timezone.now()
+                modified = storage.get_modified_time(name)
+            except FileNotFoundError:
+                # файл успел удалить release_image
+                continue
+            if modified < self.cutoff:
+                yield name
+
+    def remove_image(self, storage: Storage, name: str) -> None:
+        # как в release_image: загрузка той же картинки могла взять файл
+        # после проверки пачки
+        with blob_lock(name):
+            if is_pinned(name) or Post.objects.filter(image=name).exists():
+                return
+            self.remove(storage, name)
+
+    def remove(self, storage: Storage, name: str) -> None:
+        try:
+            size = storage.size(name)
+        except FileNotFoundError:
+            return
+        self.removed += 1
+        self.reclaimed += size
+        if self.options['dry_run']:
+            self.stdout.write(f'{name} ({filesizeformat(size)})')
+            return
+        # запись sorl о файле, а для картинки - и о ее миниатюрах
+        default.kvstore.delete(ImageFile(name, storage))
+        storage.delete(name)
@@ -0,0 +1,73 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from posts.feeds import get_merge_feed
+from posts.models import Post, User
+from posts.paginators import MergeFeedPaginator
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает ленту подписок на запросе с IN по авторам и '
+        'слияние колец последних постов из кэша'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Чья лента подписок')
+        parser.add_argument(
+            '--pages', type=int, default=5, help='Сколько страниц листать'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20, help='Число повторов'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'Нет пользователя {options["username"]}')
+
+        self.pages = options['pages']
+        self.repeat = options['repeat']
+        self.report('orm', self.orm_feed, user)
+        cache.clear()
+        self.report('merge (холодный кэш)', self.merge_feed, user, 1)
+        self.report('merge', self.merge_feed, user)
+
+    def orm_feed(self, user: User) -> None:
+        author_list = [follow.author for follow in user.follower.all()]
+        post_list = Post.objects.select_related(
+            'author', 'group').filter(author__in=author_list)
+        paginator = Paginator(post_list, settings.NUMBER_OF_LINES_ON_PAGE)
+        for number in range(1, self.pages + 1):
+            list(paginator.get_page(number))
+
+    def merge_feed(self, user: User) -> None:
+        paginator = MergeFeedPaginator(
+            get_merge_feed(user), settings.NUMBER_OF_LINES_ON_PAGE
+        )
+        cursor = None
+        for _ in range(self.pages):
+            page = paginator.get_page(cursor)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+
+    def report(self, name, feed, user, repeat=None) -> None:
+        repeat = repeat or self.repeat
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(repeat):
+                feed(user)
+            elapsed = time.perf_counter() - started
+        pages = repeat * self.pages
+        self.stdout.write(
+            f'{name}: {elapsed / pages * 1000:.2f} мс/стр., '
+            f'{len(queries) / pages:.1f} запросов/стр.'
+        )
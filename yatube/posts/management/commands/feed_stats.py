@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from posts.models import Follow, User
+
+
+def bucket_bounds(followers: int):
+    """Логарифмическая корзина: 1, 2-9, 10-99, 100-999 и т.д."""
+    if followers < 2:
+        return followers, followers
+    low = 10 ** (len(str(followers)) - 1)
+    return max(low, 2), low * 10 - 1
+
+
+class Command(BaseCommand):
+    help = (
+        'Распределение числа подписчиков по авторам для настройки '
+        'FEED_CELEBRITY_THRESHOLD'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold',
+            type=int,
+            default=settings.FEED_CELEBRITY_THRESHOLD,
+            help='Порог числа подписчиков для проверки',
+        )
+
+    def handle(self, *args, **options):
+        threshold = options['threshold']
+        counts = sorted(
+            Follow.objects.values('author')
+            .annotate(followers=Count('pk'))
+            .order_by()
+            .values_list('followers', flat=True)
+            .iterator()
+        )
+        silent_authors = User.objects.count() - len(counts)
+        total_rows = sum(counts)
+
+        buckets = {}
+        for followers in counts:
+            bounds = bucket_bounds(followers)
+            authors, rows = buckets.get(bounds, (0, 0))
+            buckets[bounds] = (authors + 1, rows + followers)
+
+        self.stdout.write(f'Авторов без подписчиков: {silent_authors}')
+        self.stdout.write(f'Авторов с подписчиками: {len(counts)}')
+        self.stdout.write(f'Всего подписок: {total_rows}')
+        self.stdout.write('')
+        self.stdout.write(
+            f'{"подписчиков":>15} {"авторов":>10} {"подписок":>12}'
+        )
+        for (low, high), (authors, rows) in sorted(buckets.items()):
+            label = str(low) if low == high else f'{low}-{high}'
+            self.stdout.write(f'{label:>15} {authors:>10} {rows:>12}')
+
+        if counts:
+            self.stdout.write('')
+            for percent in (50, 90, 99):
+                index = min(len(counts) - 1, len(counts) * percent // 100)
+                self.stdout.write(f'p{percent}: {counts[index]}')
+            self.stdout.write(f'max: {counts[-1]}')
+
+        celebrities = [followers for followers in counts
+                       if followers >= threshold]
+        pulled_rows = sum(celebrities)
+        share = pulled_rows / total_rows * 100 if total_rows else 0
+        self.stdout.write('')
+        self.stdout.write(
+            f'Порог {threshold}: популярных авторов {len(celebrities)}, '
+            f'они дают {share:.1f}% записей ленты при раскладке'
+        )
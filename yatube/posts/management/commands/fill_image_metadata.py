@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from posts.models import Post, read_image_metadata
+
+
+class Command(BaseCommand):
+    help = 'Заполняет метаданные картинок постов, загруженных раньше'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов читать из БД за раз'
+        )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        # только id и имя файла: загрузка постов целиком не нужна
+        posts = Post.objects.exclude(image='').filter(
+            Q(image_hash='') | Q(image_width__isnull=True),
+            image_missing=False
+        ).order_by('pk').values_list('pk', 'image')
+        filled = missing = failed = 0
+        last = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last)[:options['batch_size']])
+            if not batch:
+                break
+            last = batch[-1][0]
+            for pk, name in batch:
+                try:
+                    with storage.open(name, 'rb') as file:
+                        metadata = read_image_metadata(file)
+                except FileNotFoundError:
+                    # нулевые размеры и флаг: пост больше не выбирается
+                    # командой, а вывод не ищет файл
+                    self.stderr.write(f'Пост {pk}: нет файла {name}')
+                    metadata = {
+                        'image_width': 0,
+                        'image_height': 0,
+                        'image_missing': True,
+                    }
+                    missing += 1
+                except (OSError, ValueError) as error:
+                    self.stderr.write(f'Пост {pk}: {error}')
+                    failed += 1
+                    continue
+                else:
+                    filled += 1
+                # update, а не save: метаданные не меняют страницы
+                Post.objects.filter(pk=pk).update(**metadata)
+        self.stdout.write(self.style.SUCCESS(
+            f'Заполнено постов: {filled}, без файла: {missing}, '
+            f'с ошибками: {failed}'
+        ))
@@ -0,0 +1,41 @@
+from concurrent.futures import wait
+
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import posts_without_thumbnails, submit_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Создает миниатюры постов, загруженных до фоновой генерации'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов проверять одним запросом к хранилищу sorl'
+        )
+
+    def handle(self, *args, **options):
+        # посты с готовыми миниатюрами не трогаем: генерация меняет
+        # updated_at и сбрасывает страницы поста
+        posts = Post.objects.exclude(image='').order_by('pk').values_list(
+            'pk', 'image'
+        )
+        checked = scheduled = 0
+        last = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last)[:options['batch_size']])
+            if not batch:
+                break
+            last = batch[-1][0]
+            checked += len(batch)
+            # очередь воркера ограничена пачкой
+            futures = [
+                submit_thumbnails(pk)
+                for pk in posts_without_thumbnails(batch)
+            ]
+            wait(futures)
+            scheduled += len(futures)
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено постов: {checked}, созданы миниатюры: {scheduled}'
+        ))
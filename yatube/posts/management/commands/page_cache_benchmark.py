@@ -0,0 +1,78 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from core.cache import invalidate_tags
+
+
+class Command(BaseCommand):
+    help = (
+        'Сколько запросов к БД делают одновременные обращения к странице '
+        'сразу после сброса ее кэша - без защиты от лавины и с ней'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='/', help='Какую страницу запрашивать'
+        )
+        parser.add_argument(
+            '--tag', default='feed:index', help='Какой тег сбрасывать'
+        )
+        parser.add_argument(
+            '--threads', type=int, default=20, help='Число воркеров'
+        )
+        parser.add_argument(
+            '--rounds', type=int, default=5, help='Число сбросов кэша'
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        with override_settings(
+            PAGE_CACHE_LEASE_TIMEOUT=0, PAGE_CACHE_EARLY_BETA=0
+        ):
+            self.report('без защиты')
+        self.report('с блокировкой')
+
+    def report(self, name: str) -> None:
+        cache.clear()
+        Client().get(self.options['url'])
+        queries = []
+        started = time.perf_counter()
+        for _ in range(self.options['rounds']):
+            invalidate_tags(self.options['tag'])
+            queries.append(self.burst())
+        elapsed = time.perf_counter() - started
+        rounds = self.options['rounds']
+        self.stdout.write(
+            f'{name}: {sum(queries) / rounds:.1f} запросов к БД '
+            f'на сброс, {elapsed / rounds * 1000:.1f} мс на сброс'
+        )
+
+    def burst(self) -> int:
+        barrier = threading.Barrier(self.options['threads'])
+        counts = []
+
+        def worker():
+            client = Client()
+            barrier.wait()
+            try:
+                with CaptureQueriesContext(connection) as queries:
+                    client.get(self.options['url'])
+                counts.append(len(queries))
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=worker)
+            for _ in range(self.options['threads'])
+        ]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return sum(counts)
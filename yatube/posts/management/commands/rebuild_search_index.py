@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from posts.search import install_search_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересоздает полнотекстовый индекс постов и его триггеры, '
+        'например после миграции, пересоздавшей таблицу постов'
+    )
+
+    def handle(self, *args, **options):
+        # schema_editor сам выполняет все в одной транзакции
+        with connection.schema_editor() as editor:
+            install_search_index(editor)
+        self.stdout.write(self.style.SUCCESS('Индекс поиска пересоздан'))
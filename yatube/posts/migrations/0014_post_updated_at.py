@@ -0,0 +1,20 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, help_text='Дата последнего изменения', verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:55
+
+from django.db import migrations, models
+import posts.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_image_metadata'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, height_field='image_height', help_text='Выберите изображение для загрузки', storage=posts.storage.ContentAddressedStorage(), upload_to=posts.storage.image_upload_to, verbose_name='Картинка', width_field='image_width'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:20
+
+from django.db import migrations
+
+from posts.search import drop_search_index, install_search_index
+
+
+def install(apps, schema_editor):
+    install_search_index(schema_editor)
+
+
+def drop(apps, schema_editor):
+    drop_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, drop),
+    ]
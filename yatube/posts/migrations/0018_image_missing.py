@@ -0,0 +1,32 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:30
+
+from django.db import migrations, models
+import posts.storage
+from posts.search import install_search_index
+
+
+def install(apps, schema_editor):
+    # SQLite пересоздает posts_post, и триггеры индекса пропадают
+    install_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_post_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, install),
+        migrations.AddField(
+            model_name='post',
+            name='image_missing',
+            field=models.BooleanField(default=False, editable=False, help_text='Метаданные не заполнить: файла нет в хранилище', verbose_name='Файл картинки не найден'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, help_text='Выберите изображение для загрузки', storage=posts.storage.ContentAddressedStorage(), upload_to=posts.storage.image_upload_to, verbose_name='Картинка'),
+        ),
+        migrations.RunPython(install, migrations.RunPython.noop),
+    ]
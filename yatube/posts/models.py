@@ -1,13 +1,43 @@
+import hashlib
+
 from django.contrib.auth import get_user_model
 from django.db import models
+from PIL import Image
+
+from .storage import ContentAddressedStorage, image_upload_to
 
 User = get_user_model()
 
 
+def read_image_metadata(file) -> dict:
+    """Размеры, формат, размер в байтах и SHA-256 открытой картинки."""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    with Image.open(file) as picture:
+        width, height = picture.size
+        image_format = picture.format or ''
+    file.seek(0)
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_size': file.size,
+        'image_format': image_format,
+        'image_hash': digest.hexdigest(),
+        'image_missing': False,
+    }
+
+
 class Group(models.Model):
     title = models.CharField(verbose_name='Имя', max_length=200)
     slug = models.SlugField(verbose_name='Идентификатор', unique=True)
     description = models.TextField(verbose_name='Описание')
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Число постов',
+        default=0,
+        editable=False
+    )
 
     def __str__(self) -> str:
         return self.title
@@ -23,6 +53,11 @@ class Post(models.Model):
         auto_now_add=True,
         help_text='Дата публикации'
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        help_text='Дата последнего изменения'
+    )
     author = models.ForeignKey(
         User,
         verbose_name='Автор',
@@ -41,17 +76,93 @@ class Post(models.Model):
     )
     image = models.ImageField(
         verbose_name='Картинка',
-        upload_to='posts/',
+        upload_to=image_upload_to,
+        storage=ContentAddressedStorage(),
         blank=True,
+        db_index=True,
         help_text='Выберите изображение для загрузки'
     )
+    # метаданные картинки считаются один раз при загрузке, чтобы не
+    # открывать файл при выводе; ширину и высоту не доверяем
+    # width_field/height_field: для строк без размеров поле открывает
+    # файл при каждой загрузке поста из БД
+    image_width = models.PositiveIntegerField(
+        verbose_name='Ширина картинки',
+        null=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        verbose_name='Высота картинки',
+        null=True,
+        editable=False
+    )
+    image_size = models.PositiveIntegerField(
+        verbose_name='Размер картинки, байт',
+        null=True,
+        editable=False
+    )
+    image_format = models.CharField(
+        verbose_name='Формат картинки',
+        max_length=10,
+        blank=True,
+        editable=False
+    )
+    image_hash = models.CharField(
+        verbose_name='SHA-256 картинки',
+        max_length=64,
+        blank=True,
+        editable=False
+    )
+    image_missing = models.BooleanField(
+        verbose_name='Файл картинки не найден',
+        default=False,
+        editable=False,
+        help_text='Метаданные не заполнить: файла нет в хранилище'
+    )
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Число комментариев',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        uploaded = self.image and not self.image._committed
+        if uploaded or (not self.image and self.image_hash):
+            self.fill_image_metadata()
+        super().save(*args, **kwargs)
+
+    def fill_image_metadata(self) -> None:
+        """Размеры, размер, формат и хэш загружаемой картинки."""
+        if not self.image:
+            self.image_width = self.image_height = self.image_size = None
+            self.image_format = ''
+            self.image_hash = ''
+            self.image_missing = False
+            return
+        self.image.open('rb')
+        for field, value in read_image_metadata(self.image).items():
+            setattr(self, field, value)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -78,6 +189,14 @@ class Comment(models.Model):
         help_text='Дата комментария'
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_created_idx'
+            ),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -94,3 +213,74 @@ class Follow(models.Model):
         related_name='following',
         help_text='Автор'
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='unique_follow'
+            ),
+        ]
+
+
+class AuthorStats(models.Model):
+    """Счетчики пользователя, обновляемые при изменении данных."""
+
+    user = models.OneToOneField(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Число постов',
+        default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Число подписчиков',
+        default=0,
+        db_index=True
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Число подписок',
+        default=0
+    )
+
+
+class FeedItem(models.Model):
+    """Запись материализованной ленты подписок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        help_text='Владелец ленты'
+    )
+    post = models.ForeignKey(
+        Post,
+        verbose_name='Пост',
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        help_text='Пост в ленте'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+        help_text='Копия даты публикации поста для сортировки ленты'
+    )
+
+    class Meta:
+        ordering = ['-pub_date', '-post_id']
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feeditem_user_pub_date_idx'
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_feed_item'
+            ),
+        ]
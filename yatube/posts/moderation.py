@@ -0,0 +1,162 @@
+import logging
+from collections import Counter
+from typing import Iterator, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from core.cache import invalidate_tags
+
+from . import counters
+from .models import Comment, FeedItem, Group, Post, User
+from .paginators import invalidate_feed_counts
+from .recent_posts import invalidate_ring
+from .signals import release_image
+
+logger = logging.getLogger(__name__)
+
+
+class ModerationReport(NamedTuple):
+    posts: int = 0
+    comments: int = 0
+    batches: int = 0
+
+    def __add__(self, other: 'ModerationReport') -> 'ModerationReport':
+        return ModerationReport(*(a + b for a, b in zip(self, other)))
+
+
+def pk_batches(queryset: QuerySet) -> Iterator[List[int]]:
+    """id строк queryset пачками по MODERATION_BATCH_SIZE.
+
+    Следующая пачка ищется после последнего id предыдущей, поэтому
+    память не зависит от размера выборки, а удаленные строки не
+    сдвигают выборку.
+    """
+    size = settings.MODERATION_BATCH_SIZE
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    last = None
+    while True:
+        batch = list(
+            (pks if last is None else pks.filter(pk__gt=last))[:size]
+        )
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+
+
+def page_tags(post_ids, author_ids, group_ids) -> list:
+    """Теги страниц, на которых видны посты, как в invalidate_post_pages."""
+    tags = ['feed:index']
+    tags.extend(f'post:{pk}' for pk in post_ids)
+    tags.extend(f'author:{pk}' for pk in author_ids)
+    tags.extend(f'group:{pk}' for pk in group_ids if pk is not None)
+    return tags
+
+
+def move_batch(pks: List[int], group: Optional[Group]) -> int:
+    group_id = group.pk if group is not None else None
+    posts = Post.objects.filter(pk__in=pks).exclude(group_id=group_id)
+    with transaction.atomic():
+        rows = list(
+            posts.select_for_update().values_list('author_id', 'group_id')
+        )
+        # update() минует auto_now, а по updated_at кешируются карточки
+        moved = posts.update(group_id=group_id, updated_at=timezone.now())
+        old_groups = Counter(old for _, old in rows)
+        for old_group_id, count in old_groups.items():
+            counters.bump_group(old_group_id, -count)
+        counters.bump_group(group_id, moved)
+    group_ids = {group_id, *old_groups}
+    invalidate_feed_counts(
+        *(f'group:{pk}' for pk in group_ids if pk is not None)
+    )
+    invalidate_tags(
+        *page_tags(pks, {author for author, _ in rows}, group_ids)
+    )
+    return moved
+
+
+def delete_batch(pks: List[int]) -> ModerationReport:
+    """Удаляет посты одной пачки прямыми DELETE, без загрузки объектов.
+
+    Комментарии и записи лент удаляются так же, как это сделал бы
+    CASCADE; счетчики, кэши и картинки поправляются по итогам пачки.
+    """
+    posts = Post.objects.filter(pk__in=pks)
+    with transaction.atomic():
+        rows = list(posts.select_for_update().values_list(
+            'author_id', 'group_id', 'image'
+        ))
+        comments = Comment.objects.filter(post_id__in=pks)._raw_delete(
+            posts.db
+        )
+        FeedItem.objects.filter(post_id__in=pks)._raw_delete(posts.db)
+        deleted = posts._raw_delete(posts.db)
+        authors = Counter(author for author, _, _ in rows)
+        groups = Counter(group for _, group, _ in rows)
+        for author_id, count in authors.items():
+            counters.bump_author(author_id, posts_count=-count)
+        for group_id, count in groups.items():
+            counters.bump_group(group_id, -count)
+        for image in {image for _, _, image in rows if image}:
+            release_image(image)
+
+    for author_id in authors:
+        invalidate_ring(author_id)
+    invalidate_feed_counts(
+        'index',
+        *(f'author:{pk}' for pk in authors),
+        *(f'group:{pk}' for pk in groups if pk is not None),
+    )
+    invalidate_tags(*page_tags(pks, authors, groups))
+    return ModerationReport(posts=deleted, comments=comments, batches=1)
+
+
+def delete_comments_batch(pks: List[int]) -> ModerationReport:
+    comments = Comment.objects.filter(pk__in=pks)
+    with transaction.atomic():
+        per_post = Counter(
+            comments.select_for_update().values_list('post_id', flat=True)
+        )
+        deleted = comments._raw_delete(comments.db)
+        for post_id, count in per_post.items():
+            counters.bump_comments(post_id, -count)
+    invalidate_tags(*(f'post:{pk}' for pk in per_post))
+    return ModerationReport(comments=deleted, batches=1)
+
+
+def move_posts(queryset: QuerySet,
+               group: Optional[Group]) -> ModerationReport:
+    """Переносит посты в группу (None - убирает из группы) пачками."""
+    report = ModerationReport()
+    for pks in pk_batches(queryset):
+        report += ModerationReport(posts=move_batch(pks, group), batches=1)
+        logger.info('Перенесено постов: %s', report.posts)
+    return report
+
+
+def delete_posts(queryset: QuerySet) -> ModerationReport:
+    """Удаляет посты с комментариями пачками."""
+    report = ModerationReport()
+    for pks in pk_batches(queryset):
+        report += delete_batch(pks)
+        logger.info(
+            'Удалено постов: %s, комментариев: %s',
+            report.posts, report.comments
+        )
+    return report
+
+
+def purge_user_content(user: User) -> ModerationReport:
+    """Удаляет все посты и комментарии пользователя, но не его самого."""
+    report = delete_posts(Post.objects.filter(author=user))
+    for pks in pk_batches(Comment.objects.filter(author=user)):
+        report += delete_comments_batch(pks)
+    logger.info(
+        'Контент пользователя %s удален: постов %s, комментариев %s',
+        user.username, report.posts, report.comments
+    )
+    return report
@@ -0,0 +1,311 @@
+import base64
+import binascii
+import heapq
+import json
+from itertools import islice
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from .recent_posts import get_rings
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+FEED_COUNT_KEY = 'feed-count:{}'
+
+
+def encode_cursor(direction: str, pub_date, pk: int) -> str:
+    raw = json.dumps([direction, pub_date.isoformat(), pk])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str) -> Optional[Tuple[str, object, int]]:
+    """Разбирает курсор, для битого токена возвращает None."""
+    try:
+        padding = '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(token + padding)
+        direction, pub_date, pk = json.loads(raw.decode())
+        pub_date = parse_datetime(pub_date)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or pub_date is None:
+        return None
+    if not isinstance(pk, int):
+        return None
+    return direction, pub_date, pk
+
+
+def feed_count_key(feed: str) -> str:
+    return FEED_COUNT_KEY.format(feed)
+
+
+def invalidate_feed_counts(*feeds: str) -> None:
+    cache.delete_many([feed_count_key(feed) for feed in feeds])
+
+
+class WindowedPage(Page):
+    """Страница, которая знает окно соседних номеров для ссылок."""
+
+    @property
+    def page_window(self) -> range:
+        size = settings.PAGINATOR_WINDOW
+        last = self.paginator.num_pages
+        first = max(1, min(self.number - size // 2, last - size + 1))
+        return range(first, min(first + size, last + 1))
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, который хранит COUNT(*) ленты в кэше.
+
+    feed - имя ленты (index, group:<id>, author:<id>), по нему счетчик
+    сбрасывается при добавлении и удалении постов.
+    """
+
+    def __init__(self, object_list, per_page, feed=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.feed = feed
+
+    @cached_property
+    def count(self) -> int:
+        if self.feed is None:
+            return super().count
+        key = feed_count_key(self.feed)
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, settings.FEED_COUNT_TIMEOUT)
+        return count
+
+    def _get_page(self, *args, **kwargs) -> WindowedPage:
+        return WindowedPage(*args, **kwargs)
+
+
+class EstimatedCountPaginator(CachedCountPaginator):
+    """Paginator списка постов в админке без COUNT(*) по всей таблице.
+
+    Без фильтров число постов берется из счетчика ленты index, который
+    хранится в кэше. С фильтрами и поиском строки считаются не дальше
+    ADMIN_COUNT_LIMIT: на глубокие страницы никто не переходит, а точный
+    COUNT(*) по миллионам строк стоит дорого.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True):
+        super().__init__(
+            object_list, per_page,
+            feed=None if object_list.query.where else 'index',
+            orphans=orphans,
+            allow_empty_first_page=allow_empty_first_page,
+        )
+
+    @cached_property
+    def count(self) -> int:
+        if self.feed is not None:
+            return super().count
+        limit = settings.ADMIN_COUNT_LIMIT
+        return self.object_list.order_by()[:limit].count()
+
+
+class CursorPage(Page):
+    """Страница ленты без номера: навигация только по курсорам."""
+
+    cursor_based = True
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        super().__init__(object_list, None, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<CursorPage>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class CursorPaginator(Paginator):
+    """Keyset-пагинация по (pub_date, id) от новых постов к старым.
+
+    В отличие от Paginator не делает COUNT(*) и OFFSET: каждая страница
+    это один запрос по индексу с условием относительно курсора.
+    """
+
+    date_field = 'pub_date'
+    key_field = 'pk'
+    # поддерживает ли лента старые ссылки ?page=N через OFFSET
+    allow_offset = True
+
+    @staticmethod
+    def prepare_rows(rows):
+        """Превращает строки выборки в объекты страницы."""
+        return rows
+
+    def get_page(self, cursor: Optional[str]) -> CursorPage:
+        position = decode_cursor(cursor) if cursor else None
+        direction = position[0] if position else NEXT
+        rows = self._rows(position, direction)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        has_cursor = position is not None
+
+        if direction == PREVIOUS:
+            if not has_more:
+                # дошли до начала ленты - отдаем полную первую страницу
+                return self.get_page(None)
+            rows.reverse()
+            has_more, has_cursor = has_cursor, has_more
+
+        next_cursor = None
+        previous_cursor = None
+        if rows and has_more:
+            next_cursor = self._cursor(NEXT, rows[-1])
+        if rows and has_cursor:
+            previous_cursor = self._cursor(PREVIOUS, rows[0])
+        return CursorPage(
+            self.prepare_rows(rows), self, next_cursor, previous_cursor
+        )
+
+    def _rows(self, position, direction) -> list:
+        return self._slice(
+            self.object_list, position, direction,
+            self.date_field, self.key_field
+        )
+
+    def _slice(self, queryset, position, direction, date_field, key_field):
+        """Выбирает per_page + 1 строк после курсора в нужную сторону.
+
+        Лишняя строка показывает, есть ли что-то дальше.
+        """
+        if position is not None:
+            _, pub_date, pk = position
+            lookup = 'lt' if direction == NEXT else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{date_field}__{lookup}': pub_date})
+                | Q(**{date_field: pub_date, f'{key_field}__{lookup}': pk})
+            )
+        if direction == NEXT:
+            queryset = queryset.order_by(f'-{date_field}', f'-{key_field}')
+        else:
+            queryset = queryset.order_by(date_field, key_field)
+        return list(queryset[:self.per_page + 1])
+
+    def _cursor(self, direction: str, row) -> str:
+        return encode_cursor(
+            direction,
+            getattr(row, self.date_field),
+            getattr(row, self.key_field),
+        )
+
+
+class CommentPaginator(CursorPaginator):
+    """Комментарии поста от новых к старым по (created, id).
+
+    Условие и порядок совпадают с индексом comment_post_created_idx.
+    """
+
+    date_field = 'created'
+    allow_offset = False
+
+
+class TimelinePaginator(CursorPaginator):
+    """Пагинация материализованной ленты подписок (FeedItem)."""
+
+    key_field = 'post_id'
+
+    @staticmethod
+    def prepare_rows(rows):
+        return [item.post for item in rows]
+
+
+class HybridFeedPaginator(CursorPaginator):
+    """Лента подписок из двух источников, слитых при чтении.
+
+    object_list - пара (FeedItem queryset, Post queryset): разложенные
+    заранее записи ленты и посты популярных авторов, которые не
+    раскладываются по подписчикам и читаются напрямую.
+    """
+
+    allow_offset = False
+
+    def _rows(self, position, direction) -> list:
+        timeline, pulled = self.object_list
+        pushed_rows = [
+            item.post for item in self._slice(
+                timeline, position, direction, 'pub_date', 'post_id'
+            )
+        ]
+        pulled_rows = self._slice(
+            pulled, position, direction, 'pub_date', 'pk'
+        )
+        merged = heapq.merge(
+            pushed_rows,
+            pulled_rows,
+            key=lambda post: (post.pub_date, post.pk),
+            reverse=direction == NEXT,
+        )
+        rows = []
+        seen = set()
+        for post in merged:
+            # пост мог попасть в ленту до того, как автор стал популярным
+            if post.pk in seen:
+                continue
+            seen.add(post.pk)
+            rows.append(post)
+            if len(rows) > self.per_page:
+                break
+        return rows
+
+
+class MergeFeedPaginator(CursorPaginator):
+    """Лента подписок из последних постов авторов, хранящихся в кэше.
+
+    object_list - пара (id авторов, Post queryset). Страница собирается
+    слиянием колец авторов через кучу, поэтому стоимость зависит от
+    размера страницы, а не от числа авторов. Если кольца не покрывают
+    нужный диапазон (глубокие страницы), используется запрос в БД.
+    """
+
+    allow_offset = False
+
+    def _rows(self, position, direction) -> list:
+        author_ids, queryset = self.object_list
+        rings = get_rings(author_ids).values()
+        # старше самого старого элемента полного кольца данные неполные
+        boundary = max(
+            (ring[-1] for ring in rings
+             if len(ring) >= settings.FEED_RING_SIZE),
+            default=None,
+        )
+        cursor = position[1:] if position else None
+
+        if direction == NEXT:
+            merged = heapq.merge(*rings, reverse=True)
+            if cursor is not None:
+                merged = (key for key in merged if key < cursor)
+        else:
+            if boundary is not None and cursor < boundary:
+                return self._slice(
+                    queryset, position, direction, 'pub_date', 'pk'
+                )
+            merged = heapq.merge(*(reversed(ring) for ring in rings))
+            merged = (key for key in merged if key > cursor)
+
+        keys = list(islice(merged, self.per_page + 1))
+        if direction == NEXT and boundary is not None and (
+            len(keys) <= self.per_page or keys[-1] < boundary
+        ):
+            return self._slice(
+                queryset, position, direction, 'pub_date', 'pk'
+            )
+
+        posts = queryset.in_bulk([pk for _, pk in keys])
+        return [posts[pk] for _, pk in keys if pk in posts]
@@ -0,0 +1,77 @@
+from typing import Dict, Iterable, List, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Post
+
+RING_KEY = 'feeds:recent:{}'
+
+# (pub_date, pk) последних постов автора, от новых к старым
+Ring = List[Tuple[object, int]]
+
+
+def ring_key(author_id: int) -> str:
+    return RING_KEY.format(author_id)
+
+
+def load_rings(author_ids: List[int]) -> Dict[int, Ring]:
+    """Строит кольца нескольких авторов одним запросом.
+
+    Посты нумеруются внутри автора оконной функцией, внешний запрос
+    оставляет первые FEED_RING_SIZE - с ростом числа авторов растет
+    размер ответа, но не число запросов.
+    """
+    ranked = Post.objects.filter(author_id__in=author_ids).annotate(
+        ring_position=Window(
+            RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('pk').desc()],
+        )
+    ).values('pk', 'author_id', 'pub_date', 'ring_position')
+    sql, params = ranked.query.sql_with_params()
+    # фильтр по окну в Django 2.2 не поддерживается, поэтому запрос
+    # оборачивается вручную; raw() приводит pub_date к datetime сам
+    posts = Post.objects.raw(
+        f'SELECT id, author_id, pub_date FROM ({sql}) '
+        f'WHERE ring_position <= %s '
+        f'ORDER BY author_id, pub_date DESC, id DESC',
+        (*params, settings.FEED_RING_SIZE)
+    )
+    rings = {author_id: [] for author_id in author_ids}
+    for post in posts:
+        rings[post.author_id].append((post.pub_date, post.pk))
+    return rings
+
+
+def get_rings(author_ids: Iterable[int]) -> Dict[int, Ring]:
+    """Возвращает последние посты авторов одним обращением к кэшу.
+
+    Отсутствующие в кэше кольца строятся из БД одним запросом.
+    """
+    author_ids = list(author_ids)
+    cached = cache.get_many([ring_key(author_id) for author_id in author_ids])
+    rings = {}
+    missing = []
+    for author_id in author_ids:
+        ring = cached.get(ring_key(author_id))
+        if ring is None:
+            missing.append(author_id)
+        else:
+            rings[author_id] = ring
+    if missing:
+        loaded = load_rings(missing)
+        cache.set_many(
+            {ring_key(author_id): ring for author_id, ring in loaded.items()},
+            None
+        )
+        rings.update(loaded)
+    return rings
+
+
+def invalidate_ring(author_id: int) -> None:
+    # кольцо не правим на месте, чтобы не потерять запись при гонке
+    # воркеров: следующее чтение пересоберет его одним запросом
+    cache.delete(ring_key(author_id))
@@ -0,0 +1,215 @@
+import base64
+import binascii
+import json
+import re
+import uuid
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .paginators import CursorPage
+
+SEARCH_TABLE = 'posts_post_fts'
+
+# external content: индекс хранит только токены, текст берется из
+# posts_post, а триггеры обновляют индекс вместе с таблицей
+CREATE_SEARCH_INDEX = (
+    f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+    f"text, content='posts_post', content_rowid='id', "
+    f"tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER {SEARCH_TABLE}_insert AFTER INSERT ON posts_post "
+    f"BEGIN INSERT INTO {SEARCH_TABLE}(rowid, text) "
+    f"VALUES (new.id, new.text); END",
+    f"CREATE TRIGGER {SEARCH_TABLE}_delete AFTER DELETE ON posts_post "
+    f"BEGIN INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, text) "
+    f"VALUES ('delete', old.id, old.text); END",
+    f"CREATE TRIGGER {SEARCH_TABLE}_update AFTER UPDATE OF text "
+    f"ON posts_post "
+    f"BEGIN INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, text) "
+    f"VALUES ('delete', old.id, old.text); "
+    f"INSERT INTO {SEARCH_TABLE}(rowid, text) "
+    f"VALUES (new.id, new.text); END",
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')",
+)
+DROP_SEARCH_INDEX = (
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_update',
+    f'DROP TABLE IF EXISTS {SEARCH_TABLE}',
+)
+
+# символы из частной области Unicode не встречаются в тексте постов,
+# ими snippet() отмечает найденные слова до экранирования HTML
+MARK_START = '\ue000'
+MARK_END = '\ue001'
+SNIPPET_TOKENS = 24
+
+SNAPSHOT_KEY = 'search:{}'
+# столько лучших совпадений запоминается для листания результатов
+SEARCH_MAX_RESULTS = 1000
+SEARCH_SNAPSHOT_TIMEOUT = 60 * 10
+
+TERM_RE = re.compile(r'\w+')
+
+
+def search_available() -> bool:
+    return connection.vendor == 'sqlite'
+
+
+def install_search_index(schema_editor) -> None:
+    """Создает индекс FTS5 и триггеры и заполняет индекс.
+
+    SQLite пересоздает таблицу при части миграций AlterField, и триггеры
+    пропадают вместе со старой таблицей - тогда индекс нужно поставить
+    заново командой rebuild_search_index.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SEARCH_INDEX + CREATE_SEARCH_INDEX:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(schema_editor) -> None:
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SEARCH_INDEX:
+        schema_editor.execute(sql)
+
+
+def match_expression(query: str) -> str:
+    """Запрос пользователя для MATCH: все слова, каждое как префикс.
+
+    Синтаксис FTS5 (кавычки, NEAR, OR) пользователю не доступен, поэтому
+    ошибок разбора запроса не бывает.
+    """
+    return ' '.join(f'"{term}"*' for term in TERM_RE.findall(query))
+
+
+def matching_posts(query: str) -> RawSQL:
+    """Подзапрос с id подходящих постов для filter(pk__in=...)."""
+    return RawSQL(
+        f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+        [match_expression(query)]
+    )
+
+
+def encode_search_cursor(snapshot: str, offset: int) -> str:
+    raw = json.dumps([snapshot, offset])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_search_cursor(token: str) -> Optional[Tuple[str, int]]:
+    """Разбирает курсор, для битого токена возвращает None."""
+    try:
+        padding = '=' * (-len(token) % 4)
+        snapshot, offset = json.loads(
+            base64.urlsafe_b64decode(token + padding)
+        )
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    if not isinstance(snapshot, str) or not isinstance(offset, int):
+        return None
+    if offset < 0:
+        return None
+    return snapshot, offset
+
+
+def highlight(snippet: str) -> str:
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+def ranked_ids(match: str) -> List[int]:
+    """id лучших совпадений по bm25.
+
+    ORDER BY rank без других столбцов FTS5 сортирует сам, без временного
+    B-дерева для всех совпадений.
+    """
+    with connection.cursor() as db:
+        db.execute(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} '
+            f'MATCH %s ORDER BY rank LIMIT %s',
+            [match, SEARCH_MAX_RESULTS]
+        )
+        return [pk for pk, in db.fetchall()]
+
+
+def snippet(match: str) -> RawSQL:
+    """Фрагмент текста поста с подсвеченными словами для annotate.
+
+    Подзапрос ищет строку индекса по rowid, поэтому фрагменты
+    считаются только для постов страницы.
+    """
+    return RawSQL(
+        f'SELECT snippet({SEARCH_TABLE}, 0, %s, %s, %s, %s) '
+        f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+        f'AND rowid = {Post._meta.db_table}.id',
+        [MARK_START, MARK_END, '…', SNIPPET_TOKENS, match]
+    )
+
+
+def load_snapshot(match: str, cursor: Optional[str]) -> Tuple[str, list, int]:
+    """Снимок ранжирования запроса и позиция в нем.
+
+    bm25 зависит от статистики всего индекса и меняется с каждым
+    изменением постов, поэтому курсор ссылается не на значение rank, а
+    на позицию в снимке: список id, ранжированный при первой странице.
+    Если снимок истек, запрос ранжируется заново с той же позиции.
+    """
+    position = decode_search_cursor(cursor) if cursor else None
+    if position is not None:
+        snapshot, offset = position
+        stored = cache.get(SNAPSHOT_KEY.format(snapshot))
+        if stored is not None and stored[0] == match:
+            return snapshot, stored[1], offset
+    else:
+        offset = 0
+    return uuid.uuid4().hex, ranked_ids(match), offset
+
+
+def search_posts(query: str, cursor: Optional[str] = None,
+                 per_page: Optional[int] = None) -> CursorPage:
+    """Страница результатов поиска от лучших к худшим по bm25.
+
+    Все страницы одного поиска листают один снимок ранжирования (см.
+    load_snapshot), поэтому правки постов между страницами не дают
+    пропусков и повторов. Фрагменты текста с подсвеченными словами
+    (snippet) считаются только для постов страницы.
+    """
+    per_page = per_page or settings.NUMBER_OF_LINES_ON_PAGE
+    match = match_expression(query)
+    if not match:
+        return CursorPage([], None, None, None)
+
+    snapshot, ids, offset = load_snapshot(match, cursor)
+    page_ids = ids[offset:offset + per_page]
+    next_cursor = None
+    if len(ids) > offset + per_page:
+        next_cursor = encode_search_cursor(snapshot, offset + per_page)
+        cache.set(
+            SNAPSHOT_KEY.format(snapshot), (match, ids),
+            SEARCH_SNAPSHOT_TIMEOUT
+        )
+    if not page_ids:
+        return CursorPage([], None, next_cursor, None)
+
+    posts = Post.objects.select_related('author', 'group').annotate(
+        search_snippet=snippet(match)
+    ).in_bulk(page_ids)
+    results = []
+    for pk in page_ids:
+        # пост могли удалить или исправить после снимка
+        post = posts.get(pk)
+        if post is not None and post.search_snippet is not None:
+            post.snippet = highlight(post.search_snippet)
+            results.append(post)
+    return CursorPage(results, None, next_cursor, None)
@@ -0,0 +1,158 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from core.cache import invalidate_tags
+
+from . import counters, feeds, thumbnails
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+from .paginators import invalidate_feed_counts
+from .recent_posts import invalidate_ring
+from .storage import blob_lock, is_pinned, unpin_blob
+
+
+def post_feeds(post: Post) -> list:
+    """Имена лент, в которых показывается пост."""
+    names = ['index', f'author:{post.author_id}']
+    if post.group_id is not None:
+        names.append(f'group:{post.group_id}')
+    return names
+
+
+def invalidate_post_pages(post: Post, *group_ids) -> None:
+    """Сбрасывает закэшированные страницы, на которых виден пост."""
+    tags = ['feed:index', f'post:{post.pk}', f'author:{post.author_id}']
+    tags.extend(f'group:{pk}' for pk in group_ids if pk is not None)
+    invalidate_tags(*tags)
+
+
+def release_image(name: str) -> None:
+    """Удаляет файл и его миниатюры, если на него не ссылается ни один пост.
+
+    Одинаковые картинки хранятся одним файлом, число ссылок на него -
+    число постов с этим именем картинки; оно проверяется после коммита,
+    когда ссылки уже обновлены, под блокировкой файла: параллельная
+    загрузка той же картинки либо закрепила файл, либо дождется удаления
+    и запишет его заново.
+    """
+    def release():
+        with blob_lock(name):
+            if is_pinned(name) or Post.objects.filter(image=name).exists():
+                return
+            image = ImageFile(name, Post._meta.get_field('image').storage)
+            default.kvstore.delete(image)
+            image.delete()
+
+    if name:
+        transaction.on_commit(release)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance: User, created: bool, **kwargs):
+    if created:
+        AuthorStats.objects.get_or_create(user=instance)
+        # имя могло принадлежать удаленному пользователю
+        invalidate_tags(f'profile:{instance.username}')
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance: User, **kwargs):
+    invalidate_tags(f'author:{instance.pk}')
+
+
+@receiver(pre_save, sender=Post)
+def post_pre_save(sender, instance: Post, **kwargs):
+    # запомним группу и картинку до редактирования, чтобы поправить
+    # счетчики и пересоздать миниатюры
+    if instance.pk is not None:
+        old = Post.objects.filter(pk=instance.pk).values_list(
+            'group_id', 'image'
+        ).first()
+        if old is not None:
+            instance._old_group_id, instance._old_image = old
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance: Post, created: bool, **kwargs):
+    old_image = getattr(instance, '_old_image', instance.image.name)
+    if instance.image and (created or instance.image.name != old_image):
+        # после коммита на файл ссылается видимая всем строка поста
+        name = instance.image.name
+        transaction.on_commit(lambda: unpin_blob(name))
+
+    if created:
+        feeds.fan_out_post(instance)
+        invalidate_ring(instance.author_id)
+        counters.bump_author(instance.author_id, posts_count=1)
+        counters.bump_group(instance.group_id, 1)
+        invalidate_feed_counts(*post_feeds(instance))
+        invalidate_post_pages(instance, instance.group_id)
+        if instance.image:
+            thumbnails.schedule_thumbnails(instance.pk)
+        return
+
+    if instance.image.name != old_image:
+        release_image(old_image)
+        if instance.image:
+            thumbnails.schedule_thumbnails(instance.pk)
+
+    old_group_id = getattr(instance, '_old_group_id', instance.group_id)
+    invalidate_post_pages(instance, old_group_id, instance.group_id)
+    if old_group_id != instance.group_id:
+        counters.bump_group(old_group_id, -1)
+        counters.bump_group(instance.group_id, 1)
+        invalidate_feed_counts(
+            f'group:{old_group_id}', f'group:{instance.group_id}'
+        )
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance: Post, **kwargs):
+    release_image(instance.image.name)
+    invalidate_ring(instance.author_id)
+    counters.bump_author(instance.author_id, posts_count=-1)
+    counters.bump_group(instance.group_id, -1)
+    invalidate_feed_counts(*post_feeds(instance))
+    invalidate_post_pages(instance, instance.group_id)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance: Group, **kwargs):
+    # страницы с данными группы помечены ее id, поэтому после смены slug
+    # сбрасывается и страница по старому адресу; по slug помечен только
+    # поиск группы - 404 по новому адресу
+    invalidate_tags(f'group:{instance.pk}', f'group-slug:{instance.slug}')
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance: Comment, created: bool, **kwargs):
+    if created:
+        counters.bump_comments(instance.post_id, 1)
+    invalidate_tags(f'post:{instance.post_id}')
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance: Comment, **kwargs):
+    counters.bump_comments(instance.post_id, -1)
+    invalidate_tags(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance: Follow, created: bool, **kwargs):
+    if created:
+        feeds.backfill_feed(instance.user_id, instance.author_id)
+        counters.bump_author(instance.author_id, followers_count=1)
+        counters.bump_author(instance.user_id, following_count=1)
+        invalidate_tags(f'author:{instance.author_id}')
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance: Follow, **kwargs):
+    feeds.prune_feed(instance.user_id, instance.author_id)
+    counters.bump_author(instance.author_id, followers_count=-1)
+    counters.bump_author(instance.user_id, following_count=-1)
+    feeds.author_unfollowed(instance.author_id)
+    invalidate_tags(f'author:{instance.author_id}')
@@ -0,0 +1,85 @@
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_LOCK_KEY = 'blob-lock:{}'
+BLOB_PIN_KEY = 'blob-pin:{}'
+
+# через сколько секунд блокировка снимается сама, если процесс упал
+BLOB_LOCK_TIMEOUT = 10
+BLOB_LOCK_POLL_INTERVAL = 0.01
+# сколько файл защищен от удаления, если транзакция с постом так и не
+# закоммитилась; такой файл позже удалит collect_orphan_media
+BLOB_PIN_TIMEOUT = 600
+
+
+@contextmanager
+def blob_lock(name: str):
+    """Блокировка файла по имени, то есть по хэшу содержимого.
+
+    Повторное использование файла при загрузке и проверка ссылок перед
+    удалением идут под ней по очереди.
+    """
+    key = BLOB_LOCK_KEY.format(name)
+    token = uuid.uuid4().hex
+    while not cache.add(key, token, BLOB_LOCK_TIMEOUT):
+        time.sleep(BLOB_LOCK_POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+def pin_blob(name: str) -> None:
+    cache.set(BLOB_PIN_KEY.format(name), True, BLOB_PIN_TIMEOUT)
+
+
+def unpin_blob(name: str) -> None:
+    cache.delete(BLOB_PIN_KEY.format(name))
+
+
+def is_pinned(name: str) -> bool:
+    """Файл сохранен для поста, который еще не закоммичен."""
+    return cache.get(BLOB_PIN_KEY.format(name)) is not None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище картинок постов с именами по хэшу содержимого.
+
+    Имя файла задает image_upload_to, поэтому одинаковые загрузки
+    получают одно имя: повторная загрузка не пишет файл, а берет
+    существующий.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # имя уникально для содержимого, суффиксы не нужны
+        return name
+
+    def _save(self, name, content):
+        # пока пост с картинкой не закоммичен, ссылки на файл в БД не
+        # видно; закрепление не дает release_image удалить файл, снимает
+        # его сигнал поста после коммита
+        with blob_lock(name):
+            pin_blob(name)
+            if self.exists(name):
+                # файл снова нужен: свежее время изменения не даст
+                # сборщику мусора (collect_orphan_media) удалить его
+                os.utime(self.path(name))
+                return name
+            return super()._save(name, content)
+
+
+def image_upload_to(post, filename: str) -> str:
+    """posts/ab/cd/abcd...ef.gif - по SHA-256 картинки."""
+    if not post.image_hash:
+        post.fill_image_metadata()
+    digest = post.image_hash
+    extension = os.path.splitext(filename)[1].lower()
+    return f'posts/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
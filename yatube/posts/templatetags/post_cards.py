@@ -0,0 +1,93 @@
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from posts.thumbnails import get_image_variants
+
+register = template.Library()
+
+CARD_KEY = 'article:{}:{}:{}:{}'
+CARDS_CONTEXT_KEY = '_article_cards'
+
+
+def related_version(post) -> str:
+    """Отпечаток данных автора и группы, которые выводит карточка.
+
+    У пользователя и группы нет времени изменения; автор и группа уже
+    загружены вместе с постом, поэтому отпечаток не стоит запросов.
+    """
+    group = post.group
+    fields = (
+        post.author.username,
+        post.author.get_full_name(),
+        group.slug if group is not None else '',
+        group.title if group is not None else '',
+    )
+    return hashlib.md5('\0'.join(fields).encode()).hexdigest()[:12]
+
+
+def card_key(post, with_author_links: bool) -> str:
+    # версия карточки - время изменения поста и отпечаток автора и
+    # группы, поэтому правка поста или переименование автора или группы
+    # сами делают старую карточку недоступной
+    return CARD_KEY.format(
+        post.pk, post.updated_at.timestamp(), related_version(post),
+        int(with_author_links)
+    )
+
+
+def render_cards(posts, author) -> list:
+    """Рендерит карточки; картинки всех постов ищутся одним запросом."""
+    images = get_image_variants([post.image for post in posts])
+    return [
+        render_to_string(
+            'includes/article.html',
+            {
+                'post': post,
+                'author': author,
+                'image': images.get(post.image.name),
+            }
+        )
+        for post in posts
+    ]
+
+
+@register.simple_tag(takes_context=True)
+def prefetch_article_cards(context, posts) -> str:
+    """Достает карточки всех постов страницы одним get_many.
+
+    Недостающие карточки рендерятся и сохраняются одним set_many.
+    """
+    author = context.get('author')
+    keys = {card_key(post, bool(author)): post for post in posts}
+    cards = cache.get_many(keys)
+    missing_keys = [key for key in keys if key not in cards]
+    missing = dict(zip(
+        missing_keys,
+        render_cards([keys[key] for key in missing_keys], author)
+    ))
+    if missing:
+        cache.set_many(missing, settings.ARTICLE_CACHE_TIMEOUT)
+        cards.update(missing)
+    context[CARDS_CONTEXT_KEY] = {
+        post.pk: cards[key] for key, post in keys.items()
+    }
+    return ''
+
+
+@register.simple_tag
+def image_variants(image):
+    return get_image_variants([image]).get(image.name)
+
+
+@register.simple_tag(takes_context=True)
+def article_card(context, post) -> str:
+    cards = context.get(CARDS_CONTEXT_KEY) or {}
+    card = cards.get(post.pk)
+    if card is None:
+        card, = render_cards([post], context.get('author'))
+    return mark_safe(card)
@@ -0,0 +1,210 @@
+from datetime import datetime
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.query_budget import record_queries
+from posts.models import AuthorStats, Comment, Group, Post, User
+
+
+class TestPostAdmin(TestCase):
+    """Проверяем список постов в админке."""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin'
+        )
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:posts_post_changelist')
+
+    def create_posts(self, count: int, text: str = 'Пост') -> list:
+        posts = []
+        for i in range(count):
+            group = Group.objects.create(
+                title=f'Группа {text} {i}', slug=f'group-{text}-{i}',
+                description='Группа'
+            )
+            posts.append(Post.objects.create(
+                text=f'{text} {i}', author=self.author, group=group
+            ))
+        return posts
+
+    def count_queries(self, params=None) -> int:
+        cache.clear()
+        with record_queries() as log:
+            self.client.get(self.url, params)
+        return len(log)
+
+    def test_queries_do_not_grow_with_rows(self):
+        """Автор и группа строк присоединяются, подписи групп без запросов."""
+        self.create_posts(2)
+        expected = self.count_queries()
+        self.create_posts(10, text='Еще')
+        self.assertEqual(self.count_queries(), expected)
+
+    def test_group_autocomplete(self):
+        """Группа в строке выбирается через autocomplete."""
+        post = self.create_posts(1)[0]
+        content = self.client.get(self.url).content.decode()
+        self.assertIn('admin-autocomplete', content)
+        self.assertIn(
+            f'<option value="{post.group_id}" selected>'
+            f'{post.group.title}</option>',
+            content
+        )
+
+    @override_settings(ADMIN_COUNT_LIMIT=2)
+    def test_estimated_count(self):
+        """Без фильтров число постов из кэша, с фильтром - до предела."""
+        self.create_posts(3)
+        self.client.get(self.url)
+        with record_queries() as log:
+            response = self.client.get(self.url)
+        self.assertFalse(any('COUNT' in sql for sql in log.queries))
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+        response = self.client.get(self.url, {'author__id__exact': 1})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_date_hierarchy_years(self):
+        """Годы для фильтра по дате - от первого до последнего поста."""
+        first, last = self.create_posts(2)
+        Post.objects.filter(pk=first.pk).update(
+            pub_date=timezone.make_aware(datetime(2020, 5, 1))
+        )
+        Post.objects.filter(pk=last.pk).update(
+            pub_date=timezone.make_aware(datetime(2022, 5, 1))
+        )
+        content = self.client.get(self.url).content.decode()
+        for year in (2020, 2021, 2022):
+            self.assertIn(f'pub_date__year={year}', content)
+
+        response = self.client.get(self.url, {'pub_date__year': 2020})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [Post.objects.get(
+                pk=first.pk
+            )]
+        )
+
+
+@override_settings(MODERATION_BATCH_SIZE=2)
+class TestPostModeration(TestCase):
+    """Проверяем массовые действия над постами в админке."""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin'
+        )
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Группа'
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа', slug='other', description='Группа'
+        )
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:posts_post_changelist')
+        self.posts = [
+            Post.objects.create(
+                text=f'Пост {i}', author=self.author, group=self.group
+            )
+            for i in range(5)
+        ]
+        self.reader_post = Post.objects.create(
+            text='Пост читателя', author=self.reader, group=self.group
+        )
+        for post in self.posts[:3]:
+            Comment.objects.create(
+                post=post, author=self.reader, text='Комментарий'
+            )
+        Comment.objects.create(
+            post=self.reader_post, author=self.author, text='Комментарий'
+        )
+
+    def act(self, action: str, posts: list, **data):
+        return self.client.post(self.url, {
+            'action': action,
+            '_selected_action': [post.pk for post in posts],
+            **data
+        })
+
+    def test_delete_selected_replaced(self):
+        """Стандартного удаления нет, есть действия модерации."""
+        actions = self.client.get(self.url).context['action_form']
+        choices = [name for name, _ in actions.fields['action'].choices]
+        self.assertNotIn('delete_selected', choices)
+        self.assertIn('delete_posts', choices)
+
+    def test_move_to_group(self):
+        """Посты переносятся пачками, счетчики групп и карточки обновляются."""
+        profile = reverse('posts:profile', args=[self.author.username])
+        self.assertContains(self.client.get(profile), '/group/group/')
+        before = Post.objects.get(pk=self.posts[0].pk).updated_at
+        response = self.act(
+            'move_to_group', self.posts, group=self.other_group.pk
+        )
+        self.assertRedirects(response, self.url)
+        self.assertEqual(
+            Post.objects.filter(group=self.other_group).count(), 5
+        )
+        self.group.refresh_from_db()
+        self.other_group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(self.other_group.posts_count, 5)
+        messages = [str(m) for m in response.wsgi_request._messages]
+        self.assertIn('пачек 3', messages[0])
+        self.assertGreater(
+            Post.objects.get(pk=self.posts[0].pk).updated_at, before
+        )
+        response = self.client.get(profile)
+        self.assertContains(response, '/group/other/')
+        self.assertNotContains(response, '/group/group/')
+
+    def test_delete_posts(self):
+        """Удаление сначала спрашивает подтверждение, потом идет пачками."""
+        selected = self.posts[:4]
+        response = self.act('delete_posts', selected)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(
+            response, 'admin/posts/post/confirm_moderation.html'
+        )
+        self.assertEqual(Post.objects.count(), 6)
+
+        response = self.act('delete_posts', selected, confirmed='yes')
+        self.assertRedirects(response, self.url)
+        self.assertEqual(
+            list(Post.objects.order_by('pk')),
+            [self.posts[4], self.reader_post]
+        )
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(AuthorStats.objects.get(
+            user=self.author
+        ).posts_count, 1)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 2)
+
+    def test_purge_authors(self):
+        """Удаляются все посты и комментарии авторов выбранных постов."""
+        response = self.act(
+            'purge_authors', [self.reader_post], confirmed='yes'
+        )
+        self.assertRedirects(response, self.url)
+        self.assertFalse(Post.objects.filter(author=self.reader).exists())
+        self.assertFalse(Comment.objects.filter(author=self.reader).exists())
+        self.assertEqual(Post.objects.count(), 5)
+        for post in Post.objects.all():
+            self.assertEqual(post.comments_count, 0)
@@ -0,0 +1,121 @@
+import time
+
+from django.core.cache import caches
+from django.test import TestCase
+
+from core.cache_backends import TwoTierCache, request_sync
+
+
+def make_worker(name: str) -> TwoTierCache:
+    # каждый воркер - своё хранилище L1 поверх общего кэша
+    return TwoTierCache('shared', {'OPTIONS': {'L1_NAME': name}})
+
+
+class TestTwoTierCache(TestCase):
+    """Проверяем двухуровневый кэш."""
+
+    def setUp(self) -> None:
+        caches['shared'].clear()
+        # статистика копится в хранилище, у каждого теста свои воркеры
+        self.first = make_worker(f'{self.id()}:first')
+        self.second = make_worker(f'{self.id()}:second')
+        self.addCleanup(caches['shared'].clear)
+
+    def test_reads_are_served_from_l1(self):
+        """Повторное чтение не ходит в общий кэш."""
+        self.first.set('key', 'value')
+        self.assertEqual(self.first.get('key'), 'value')
+        caches['shared'].delete('key')
+        self.assertEqual(self.first.get('key'), 'value')
+        stats = self.first.get_stats()
+        self.assertGreaterEqual(stats['l1_hits'], 1)
+        self.assertGreaterEqual(stats['l2_hits'], 1)
+
+    def test_write_invalidates_other_workers(self):
+        """Запись в одном воркере сбрасывает L1 другого."""
+        self.first.set('key', 'old')
+        self.assertEqual(self.second.get('key'), 'old')
+        self.first.set('key', 'new')
+        request_sync()
+        self.assertEqual(self.second.get('key'), 'new')
+        self.first.delete('key')
+        request_sync()
+        self.assertIsNone(self.second.get('key'))
+
+    def test_l1_returns_copies(self):
+        """Изменение прочитанного объекта не портит L1."""
+        self.first.set('key', {'a': 1})
+        self.first.get('key')['a'] = 2
+        self.assertEqual(self.first.get('key'), {'a': 1})
+
+    def test_get_many_and_misses(self):
+        """get_many добирает из общего кэша только промахи L1."""
+        self.first.set_many({'a': 1, 'b': 2})
+        self.assertEqual(self.first.get_many(['a', 'b', 'c']),
+                         {'a': 1, 'b': 2})
+        self.assertEqual(self.first.get_many(['a', 'b']), {'a': 1, 'b': 2})
+        stats = self.first.get_stats()
+        self.assertEqual(stats['l2_misses'], 1)
+        self.assertEqual(stats['l1_hits'], 2)
+
+    def test_l1_respects_key_timeout(self):
+        """Копия в L1 истекает вместе с ключом, а не через L1_TIMEOUT."""
+        self.first.set('short', 'value', timeout=1)
+        self.first.set('long', 'value')
+        self.assertEqual(self.first.get('short'), 'value')
+        self.assertEqual(self.second.get_many(['short']), {'short': 'value'})
+        self.first.set('zero', 'value', timeout=0)
+        self.assertIsNone(self.first.get('zero'))
+        time.sleep(1.1)
+        request_sync()
+        self.assertIsNone(self.first.get('short'))
+        self.assertEqual(self.second.get_many(['short']), {})
+        self.assertEqual(self.first.get('long'), 'value')
+
+    def test_incr_and_touch_keep_value(self):
+        """incr и touch работают со значением, а не с записью L2."""
+        self.first.set('counter', 1)
+        self.assertEqual(self.first.incr('counter', 2), 3)
+        self.assertEqual(self.second.get('counter'), 3)
+        self.assertTrue(self.first.touch('counter', 1))
+        time.sleep(1.1)
+        self.assertIsNone(self.second.get('counter'))
+
+    def test_write_drops_only_its_keys(self):
+        """Запись сбрасывает в L1 других воркеров только свои ключи."""
+        keys = {f'key{n}': n for n in range(200)}
+        self.first.set_many(keys)
+        self.assertEqual(self.second.get_many(list(keys)), keys)
+        # промах страницы: карточки, счетчик и аренда пересчета
+        self.first.set_many({f'card{n}': n for n in range(10)})
+        self.first.set('count', 1)
+        self.first.add('lease:page', 'token')
+        self.first.delete('lease:page')
+        request_sync()
+        before = self.second.get_stats()['l1_hits']
+        self.assertEqual(self.second.get_many(list(keys)), keys)
+        self.assertEqual(self.second.get_stats()['l1_hits'] - before, 200)
+
+    def test_excluded_keys_skip_l1(self):
+        """Аренды и блокировки всегда читаются из общего кэша."""
+        self.first.add('lease:page', 'token')
+        self.assertEqual(self.second.get('lease:page'), 'token')
+        caches['shared'].delete('lease:page')
+        self.assertIsNone(self.second.get('lease:page'))
+        self.assertFalse(caches['shared'].get('l1-log:seq'))
+
+    def test_lost_log_resets_l1(self):
+        """Если журнал потерян, L1 сбрасывается целиком."""
+        self.first.set('key', 'old')
+        self.assertEqual(self.second.get('key'), 'old')
+        self.first.set('key', 'new')
+        caches['shared'].delete_many(['l1-log:id', 'l1-log:seq'])
+        self.first.set('other', 'value')
+        request_sync()
+        self.assertEqual(self.second.get('key'), 'new')
+
+        self.first.set('key', 'newer')
+        seq = caches['shared'].get('l1-log:seq')
+        caches['shared'].delete(f'l1-log:{seq}')
+        request_sync()
+        self.assertEqual(self.second.get('key'), 'newer')
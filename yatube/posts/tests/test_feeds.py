@@ -0,0 +1,195 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import FeedItem, Follow, Post, User
+from posts.recent_posts import get_rings
+
+
+class TestTimeline(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.old_post = Post.objects.create(
+            text='Старый пост',
+            author=cls.author
+        )
+
+    def setUp(self) -> None:
+        self.reader_client = Client()
+        self.reader_client.force_login(TestTimeline.reader)
+
+    def feed_posts(self):
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_follow_backfills_timeline(self):
+        """При подписке в ленту попадают уже написанные посты."""
+        self.assertEqual(self.feed_posts(), [])
+        self.reader_client.get(
+            reverse('posts:profile_follow', args=[self.author.username])
+        )
+        self.assertEqual(self.feed_posts(), [self.old_post])
+
+    def test_new_post_fans_out(self):
+        """Новый пост раскладывается по лентам подписчиков."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertTrue(
+            FeedItem.objects.filter(user=self.reader, post=post).exists()
+        )
+        self.assertEqual(self.feed_posts(), [post, self.old_post])
+
+    def test_unfollow_prunes_timeline(self):
+        """После отписки посты автора пропадают из ленты."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.reader_client.get(
+            reverse('posts:profile_unfollow', args=[self.author.username])
+        )
+        self.assertFalse(FeedItem.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.feed_posts(), [])
+
+    def test_legacy_page_links(self):
+        """Ссылки ?page=N в ленте подписок отдают посты."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.reader_client.get(
+            reverse('posts:follow_index'), {'page': 1}
+        )
+        self.assertEqual(
+            list(response.context['page_obj']), [self.old_post]
+        )
+
+
+@override_settings(FOLLOW_FEED_MODE='hybrid', FEED_CELEBRITY_THRESHOLD=2)
+class TestHybridFeed(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.star = User.objects.create_user(username='star')
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.fan = User.objects.create_user(username='fan')
+        Follow.objects.create(user=cls.reader, author=cls.star)
+        Follow.objects.create(user=cls.fan, author=cls.star)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(TestHybridFeed.reader)
+
+    def test_celebrity_posts_are_pulled(self):
+        """Посты популярного автора не раскладываются, но есть в ленте."""
+        star_post = Post.objects.create(text='Звезда', author=self.star)
+        author_post = Post.objects.create(text='Автор', author=self.author)
+        self.assertFalse(FeedItem.objects.filter(post=star_post).exists())
+        self.assertTrue(FeedItem.objects.filter(post=author_post).exists())
+
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [author_post, star_post]
+        )
+
+    def test_pushed_and_pulled_posts_are_not_duplicated(self):
+        """Пост, разложенный до того, как автор стал популярным, один."""
+        post = Post.objects.create(text='Звезда', author=self.star)
+        FeedItem.objects.create(
+            user=self.reader, post=post, pub_date=post.pub_date
+        )
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [post])
+
+    def test_posts_are_pushed_after_losing_status(self):
+        """Посты бывшего популярного автора остаются в лентах подписчиков."""
+        post = Post.objects.create(text='Звезда', author=self.star)
+        self.reader_client.get(reverse('posts:follow_index'))
+        Follow.objects.filter(user=self.fan, author=self.star).delete()
+        self.assertTrue(
+            FeedItem.objects.filter(user=self.reader, post=post).exists()
+        )
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [post])
+
+    def test_feed_stats_command(self):
+        """Команда выводит распределение и число популярных авторов."""
+        out = StringIO()
+        call_command('feed_stats', stdout=out)
+        self.assertIn('Всего подписок: 3', out.getvalue())
+        self.assertIn('популярных авторов 1', out.getvalue())
+
+
+@override_settings(
+    FOLLOW_FEED_MODE='merge', FEED_RING_SIZE=3, NUMBER_OF_LINES_ON_PAGE=2
+)
+class TestMergeFeed(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [
+            User.objects.create_user(username=f'author{i}') for i in range(3)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+        for i in range(4):
+            for author in cls.authors:
+                Post.objects.create(text=f'Пост {i}', author=author)
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(TestMergeFeed.reader)
+
+    def walk(self, cursor=None, key='next_cursor'):
+        pages = []
+        while True:
+            response = self.reader_client.get(
+                reverse('posts:follow_index'),
+                {'cursor': cursor} if cursor else {}
+            )
+            page = response.context['page_obj']
+            pages.append(list(page))
+            cursor = getattr(page, key)
+            if cursor is None:
+                return pages, page
+
+    def test_merge_feed_matches_database_order(self):
+        """Слияние колец и запрос в БД дают одну и ту же ленту."""
+        expected = list(
+            Post.objects.filter(author__in=self.authors)
+            .order_by('-pub_date', '-pk')
+        )
+        pages, last_page = self.walk()
+        self.assertEqual(sum(pages, []), expected)
+
+        back, _ = self.walk(last_page.previous_cursor, 'previous_cursor')
+        self.assertEqual(sum(reversed(back), []), expected[:-2])
+
+    def test_cold_rings_in_one_query(self):
+        """Кольца всех авторов строятся одним запросом."""
+        expected = {
+            author.pk: list(
+                Post.objects.filter(author=author)
+                .order_by('-pub_date', '-pk')
+                .values_list('pub_date', 'pk')[:3]
+            )
+            for author in self.authors
+        }
+        ids = [author.pk for author in self.authors]
+        with self.assertNumQueries(1):
+            rings = get_rings(ids)
+        self.assertEqual(rings, expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_rings(ids), expected)
+
+    def test_new_post_invalidates_ring(self):
+        """Новый пост автора сразу виден в ленте."""
+        self.walk()
+        post = Post.objects.create(text='Свежий', author=self.authors[0])
+        pages, _ = self.walk()
+        self.assertEqual(pages[0][0], post)
@@ -1,3 +1,4 @@
+import hashlib
 import shutil
 import tempfile
 
@@ -70,7 +71,11 @@ class TestForm(TestCase):
         post: Post = Post.objects.all()[0]
         self.assertEqual(post.text, form_data['text'])
         self.assertEqual(post.group, Group.objects.get(pk=form_data['group']))
-        self.assertEqual(post.image, f'posts/{upload_image.name}')
+        # имя картинки - SHA-256 содержимого в шардированном каталоге
+        digest = hashlib.sha256(small_gif).hexdigest()
+        self.assertEqual(
+            post.image, f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'
+        )
 
     def test_edit_post(self):
         """Проверка корректной работы измененеия поста."""
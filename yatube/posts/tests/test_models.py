@@ -1,6 +1,27 @@
-from django.test import TestCase
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
 
-from posts.models import Group, Post, User
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from posts.management.commands.collect_orphan_media import PROGRESS_FILE
+from posts.models import AuthorStats, Comment, Follow, Group, Post, User
+from posts.storage import blob_lock, is_pinned, unpin_blob
+from posts.tests.test_thumbnails import SMALL_GIF
+from posts.thumbnails import thumbnail_files
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
 class TestModel(TestCase):
@@ -64,3 +85,270 @@ class TestModel(TestCase):
                     TestModel.post._meta.get_field(field).help_text,
                     expected_value
                 )
+
+
+class TestCounters(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа 1',
+            slug='group1',
+            description='Описание'
+        )
+        cls.other_group = Group.objects.create(
+            title='Группа 2',
+            slug='group2',
+            description='Описание'
+        )
+
+    def assert_counters(self, posts, group_posts, comments, followers):
+        stats = AuthorStats.objects.get(user=self.author)
+        self.assertEqual(stats.posts_count, posts)
+        self.assertEqual(stats.followers_count, followers)
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.reader).following_count,
+            followers
+        )
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, group_posts)
+        if comments is not None:
+            self.post.refresh_from_db()
+            self.assertEqual(self.post.comments_count, comments)
+
+    def test_counters_follow_changes(self):
+        """Счетчики меняются вместе с постами, комментариями и подписками."""
+        self.post = Post.objects.create(
+            text='Пост', author=self.author, group=self.group
+        )
+        Comment.objects.create(post=self.post, author=self.reader, text='!')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assert_counters(1, 1, 1, 1)
+
+        self.post.group = self.other_group
+        self.post.save()
+        self.other_group.refresh_from_db()
+        self.assertEqual(self.other_group.posts_count, 1)
+        self.assert_counters(1, 0, 1, 1)
+
+        Comment.objects.all().delete()
+        Follow.objects.all().delete()
+        self.assert_counters(1, 0, 0, 0)
+
+        self.post.delete()
+        self.assert_counters(0, 0, None, 0)
+
+    def test_rebuild_counters(self):
+        """Команда пересчитывает счетчики, сбитые массовой вставкой."""
+        Post.objects.bulk_create(
+            [Post(text='Пост', author=self.author, group=self.group)] * 3
+        )
+        self.post = Post.objects.create(
+            text='Пост', author=self.author, group=self.group
+        )
+        Follow.objects.bulk_create(
+            [Follow(user=self.reader, author=self.author)]
+        )
+        Comment.objects.bulk_create(
+            [Comment(post=self.post, author=self.reader, text='!')]
+        )
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assert_counters(4, 4, 1, 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class TestImageMetadata(TestCase):
+    """Проверяем метаданные картинки поста."""
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self) -> None:
+        self.post = Post.objects.create(
+            text='Пост',
+            author=User.objects.create_user(username='author'),
+            image=SimpleUploadedFile(
+                name='small.gif', content=SMALL_GIF, content_type='image/gif'
+            )
+        )
+        self.expected = {
+            'image_width': 2,
+            'image_height': 1,
+            'image_size': len(SMALL_GIF),
+            'image_format': 'GIF',
+            'image_hash': hashlib.sha256(SMALL_GIF).hexdigest(),
+        }
+
+    def assert_metadata(self, expected: dict) -> None:
+        values = Post.objects.filter(pk=self.post.pk).values(*expected)
+        self.assertEqual(values.get(), expected)
+
+    def test_filled_on_upload(self):
+        """Метаданные заполняются при загрузке и очищаются с картинкой."""
+        self.assert_metadata(self.expected)
+        self.post.image = None
+        self.post.save()
+        self.assert_metadata({'image_size': None, 'image_hash': ''})
+
+    def test_backfill(self):
+        """Команда заполняет метаданные старых постов."""
+        Post.objects.filter(pk=self.post.pk).update(
+            image_width=None,
+            image_height=None,
+            image_size=None,
+            image_format='',
+            image_hash=''
+        )
+        call_command('fill_image_metadata', stdout=StringIO())
+        self.assert_metadata(self.expected)
+
+    def test_missing_file(self):
+        """Пост без файла читается без хранилища и помечается командой."""
+        Post.objects.filter(pk=self.post.pk).update(
+            image='posts/missing.gif',
+            image_width=None,
+            image_height=None,
+            image_hash=''
+        )
+        # размеры не читаются из файла при загрузке поста
+        self.assertIsNone(Post.objects.get(pk=self.post.pk).image_width)
+        err = StringIO()
+        call_command('fill_image_metadata', stdout=StringIO(), stderr=err)
+        self.assertIn('нет файла posts/missing.gif', err.getvalue())
+        self.assert_metadata({
+            'image_width': 0, 'image_height': 0, 'image_missing': True
+        })
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class TestImageStorage(TransactionTestCase):
+    """Проверяем общее хранение одинаковых картинок."""
+
+    def setUp(self) -> None:
+        # файлы прошлых тестов попали бы в обход сборщика
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        # коммит поста отдает миниатюры воркеру, а он писал бы в базу
+        # и в cache/ одновременно с тестом и очисткой таблиц
+        patcher = mock.patch('posts.thumbnails.submit_thumbnails')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, author: User) -> Post:
+        return Post.objects.create(
+            text='Пост',
+            author=author,
+            image=SimpleUploadedFile(
+                name='small.gif', content=SMALL_GIF, content_type='image/gif'
+            )
+        )
+
+    def test_deduplicated(self):
+        """Одинаковые картинки - один файл, он удаляется с последним постом."""
+        author = User.objects.create_user(username='author')
+        first, second = self.create_post(author), self.create_post(author)
+        self.assertEqual(first.image.name, second.image.name)
+        storage = first.image.storage
+        name = first.image.name
+        self.assertEqual(storage.listdir(os.path.dirname(name))[1], [
+            os.path.basename(name)
+        ])
+
+        first.delete()
+        self.assertTrue(storage.exists(name))
+        second.delete()
+        self.assertFalse(storage.exists(name))
+
+    def test_release_keeps_pending_upload(self):
+        """Файл, снова сохраненный для незакоммиченного поста, не удаляется."""
+        author = User.objects.create_user(username='author')
+        post = self.create_post(author)
+        storage = post.image.storage
+        name = post.image.name
+        # загрузка той же картинки взяла файл, но пост еще не сохранен
+        storage.save(name, ContentFile(SMALL_GIF))
+        post.delete()
+        self.assertTrue(storage.exists(name))
+
+        # пост закоммичен - закрепление снято, файл живет, пока на него
+        # ссылаются
+        other = self.create_post(author)
+        self.assertFalse(is_pinned(name))
+        other.delete()
+        self.assertFalse(storage.exists(name))
+
+    def test_save_waits_for_release(self):
+        """Сохранение той же картинки ждет проверки ссылок на файл."""
+        post = self.create_post(User.objects.create_user(username='author'))
+        storage = post.image.storage
+        name = post.image.name
+        with blob_lock(name):
+            saving = threading.Thread(
+                target=storage.save, args=(name, ContentFile(SMALL_GIF))
+            )
+            saving.start()
+            saving.join(0.1)
+            self.assertTrue(saving.is_alive())
+            self.assertFalse(is_pinned(name))
+        saving.join()
+        self.assertTrue(is_pinned(name))
+
+    def test_collect_orphans(self):
+        """Сборщик удаляет только файлы, на которые не ссылаются постов."""
+        post = self.create_post(User.objects.create_user(username='author'))
+        storage = post.image.storage
+        _, _, thumbnail = thumbnail_files(ImageFile(post.image))[0]
+        default.storage.save(thumbnail.name, ContentFile(b'thumbnail'))
+        # миниатюру создал воркер - она записана в хранилище sorl
+        thumbnail.set_size((480, 170))
+        default.kvstore.set(thumbnail)
+        orphans = [
+            (storage, storage.save('posts/00/00/old.gif', ContentFile(b'1'))),
+            (default.storage, default.storage.save(
+                'cache/00/00/old.jpg', ContentFile(b'22')
+            )),
+        ]
+        # закрепление незакоммиченной загрузки истекает раньше min-age
+        unpin_blob(orphans[0][1])
+
+        out = StringIO()
+        call_command('collect_orphan_media', '--min-age=0', stdout=out)
+        for orphan_storage, name in orphans:
+            self.assertFalse(orphan_storage.exists(name))
+        self.assertTrue(storage.exists(post.image.name))
+        self.assertTrue(default.storage.exists(thumbnail.name))
+        self.assertIn(
+            'Удалено файлов: 2, освобождено: 3\xa0байт', out.getvalue()
+        )
+
+    def test_collect_orphans_resumes(self):
+        """С --max-batches следующий запуск продолжает с места остановки."""
+        post = self.create_post(User.objects.create_user(username='author'))
+        storage = post.image.storage
+        orphans = []
+        for letter in 'abc':
+            name = storage.save(f'posts/00/00/{letter}.gif', ContentFile(b'1'))
+            unpin_blob(name)
+            orphans.append(name)
+
+        for run in range(len(orphans)):
+            call_command(
+                'collect_orphan_media', '--min-age=0', '--batch-size=1',
+                '--max-batches=1', stdout=StringIO()
+            )
+            self.assertEqual(
+                [storage.exists(name) for name in orphans],
+                [index > run for index in range(len(orphans))]
+            )
+        # обход дошел до конца - место остановки забыто
+        call_command('collect_orphan_media', '--min-age=0', stdout=StringIO())
+        self.assertFalse(default_storage.exists(PROGRESS_FILE))
+        self.assertTrue(storage.exists(post.image.name))
@@ -0,0 +1,141 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+
+from core.query_budget import get_budget, record_queries
+from posts.models import Comment, Follow, Group, Post, User
+
+BUDGETED_NAMESPACES = ('posts', 'about', 'auth')
+
+
+def namespace_views(patterns, namespace=None):
+    """Все view из urlpatterns с их пространством имен."""
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from namespace_views(
+                pattern.url_patterns, pattern.namespace or namespace
+            )
+        elif isinstance(pattern, URLPattern):
+            yield namespace, pattern.name, pattern.callback
+
+
+@override_settings(QUERY_BUDGET_MODE='raise')
+class TestQueryBudget(TestCase):
+    """Проверяем бюджеты запросов к БД у view."""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Группа'
+        )
+        cls.post = cls.create_posts(1)[0]
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    @classmethod
+    def create_posts(cls, count: int) -> list:
+        posts = []
+        for i in range(count):
+            post = Post.objects.create(
+                text=f'Пост {i}', author=cls.author, group=cls.group
+            )
+            Comment.objects.create(
+                post=post, author=cls.reader, text=f'Комментарий {i}'
+            )
+            posts.append(post)
+        return posts
+
+    def setUp(self) -> None:
+        cache.clear()
+        # клиент создается после override_settings, чтобы middleware
+        # прочитал QUERY_BUDGET_MODE
+        self.guest = Client()
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def list_urls(self) -> list:
+        return [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:post_comments',
+                    kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+            reverse('posts:search') + '?q=пост',
+        ]
+
+    def test_every_view_has_budget(self):
+        """У каждого view приложений posts, about и users есть бюджет."""
+        for namespace, name, view in namespace_views(
+            get_resolver().url_patterns
+        ):
+            if namespace in BUDGETED_NAMESPACES:
+                with self.subTest(view=f'{namespace}:{name}'):
+                    self.assertIsNotNone(get_budget(view))
+
+    def test_pages_within_budget(self):
+        """Страницы укладываются в бюджет у гостя и у пользователя.
+
+        При превышении middleware бросает QueryBudgetExceeded.
+        """
+        urls = self.list_urls() + [
+            reverse('posts:post_create'),
+            reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+            reverse('about:author'),
+            reverse('about:tech'),
+            reverse('auth:signup'),
+            reverse('auth:login'),
+            reverse('auth:password_reset_form'),
+            reverse('auth:password_reset_done'),
+            reverse('auth:password_change'),
+            reverse('auth:password_change_done'),
+        ]
+        for url in urls:
+            for client in (self.guest, self.client, self.author_client):
+                with self.subTest(url=url):
+                    cache.clear()
+                    client.get(url)
+
+    def test_actions_within_budget(self):
+        """Формы и подписки укладываются в бюджет."""
+        post_id = self.post.pk
+        self.author_client.post(
+            reverse('posts:post_create'), {'text': 'Новый пост'}
+        )
+        self.author_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post_id}),
+            {'text': 'Исправленный пост', 'group': self.group.pk}
+        )
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post_id}),
+            {'text': 'Комментарий'}
+        )
+        profile = {'username': self.author.username}
+        self.client.get(reverse('posts:profile_unfollow', kwargs=profile))
+        self.client.get(reverse('posts:profile_follow', kwargs=profile))
+        self.client.get(reverse('auth:logout'))
+
+    def test_budget_does_not_grow_with_page(self):
+        """Число запросов не зависит от числа постов на странице."""
+        urls = self.list_urls()
+        counts = {}
+        for url in urls:
+            cache.clear()
+            with record_queries() as log:
+                self.client.get(url)
+            counts[url] = len(log)
+
+        self.create_posts(settings.NUMBER_OF_LINES_ON_PAGE)
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                with record_queries() as log:
+                    self.client.get(url)
+                self.assertEqual(len(log), counts[url], log.report())
@@ -0,0 +1,104 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+
+# перебор таблицы без индекса или сортировка во временном B-дереве;
+# проход по индексу в нужном порядке (SCAN ... USING INDEX) допустим
+BAD_PLAN = re.compile(
+    r'^SCAN (TABLE )?(?!CONSTANT ROW)(?!.*USING (COVERING )?INDEX).*$'
+    r'|USE TEMP B-TREE',
+    re.MULTILINE
+)
+
+# форма поста выводит список всех групп, тут полный перебор ожидаем
+ALLOWED_SCANS = re.compile(r'^SELECT .* FROM "posts_group"$')
+
+
+class TestQueryPlans(TestCase):
+    """Проверяем, что запросы страниц идут по индексам."""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа',
+            slug='group',
+            description='Описание'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        Post.objects.bulk_create(
+            [
+                Post(text=f'Пост {i}', author=cls.author, group=cls.group)
+                for i in range(15)
+            ]
+        )
+        cls.post = Post.objects.create(
+            text='Пост', author=cls.author, group=cls.group
+        )
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий'
+        )
+
+    def setUp(self) -> None:
+        # закэшированная главная не делает запросов и не должна
+        # попадать в соседние тесты
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.reader_client = Client()
+        self.reader_client.force_login(TestQueryPlans.reader)
+        self.author_client = Client()
+        self.author_client.force_login(TestQueryPlans.author)
+
+    def explain(self, sql: str) -> str:
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+    def assert_plans(self, client: Client, url: str) -> None:
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        page = response.context.get('page_obj')
+        if page is not None and getattr(page, 'next_cursor', None):
+            # вторая страница проверяет условие по курсору
+            with CaptureQueriesContext(connection) as next_queries:
+                client.get(url, {'cursor': page.next_cursor})
+            queries.captured_queries.extend(next_queries.captured_queries)
+
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or ALLOWED_SCANS.match(sql):
+                continue
+            plan = self.explain(sql)
+            with self.subTest(url=url, sql=sql):
+                self.assertIsNone(BAD_PLAN.search(plan), plan)
+
+    def test_feed_pages(self):
+        """Ленты читаются по индексам без сортировки."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            self.assert_plans(self.reader_client, url)
+
+    def test_post_pages(self):
+        """Страницы поста читаются по индексам без сортировки."""
+        self.assert_plans(
+            self.reader_client,
+            reverse('posts:post_detail', args=[self.post.pk])
+        )
+        self.assert_plans(
+            self.author_client,
+            reverse('posts:post_edit', args=[self.post.pk])
+        )
+        self.assert_plans(self.author_client, reverse('posts:post_create'))
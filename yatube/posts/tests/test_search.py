@@ -0,0 +1,97 @@
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post, User
+from posts.search import search_posts
+
+
+class TestSearch(TestCase):
+    """Проверяем полнотекстовый поиск по постам."""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    def create_post(self, text: str) -> Post:
+        return Post.objects.create(text=text, author=self.author)
+
+    def found(self, query: str) -> list:
+        return [post.pk for post in search_posts(query)]
+
+    def test_ranking_and_snippet(self):
+        """Лучшие совпадения первыми, слова подсвечены, HTML экранирован."""
+        once = self.create_post('Привет, <b>мир</b>!')
+        often = self.create_post('Мир, мир и еще раз мир')
+        self.create_post('Про другое')
+
+        page = search_posts('мир')
+        self.assertEqual([post.pk for post in page], [often.pk, once.pk])
+        self.assertIn('<mark>Мир</mark>', page[0].snippet)
+        self.assertIn('&lt;b&gt;<mark>мир</mark>&lt;/b&gt;', page[1].snippet)
+        # слова ищутся по началу, синтаксис FTS5 из запроса не работает
+        self.assertEqual(self.found('прив'), [once.pk])
+        self.assertEqual(self.found('"мир" OR *'), [])
+
+    def test_index_follows_table(self):
+        """Триггеры обновляют индекс при изменении и удалении поста."""
+        post = self.create_post('Старый текст')
+        post.text = 'Новый текст'
+        post.save()
+        self.assertEqual(self.found('старый'), [])
+        self.assertEqual(self.found('новый'), [post.pk])
+        post.delete()
+        self.assertEqual(self.found('новый'), [])
+
+    @override_settings(NUMBER_OF_LINES_ON_PAGE=2)
+    def test_cursor(self):
+        """Результаты идут страницами по курсору без повторов."""
+        posts = [self.create_post('одинаковый текст') for _ in range(5)]
+        url = reverse('posts:search')
+        found = []
+        params = {'q': 'текст'}
+        while True:
+            page = self.client.get(url, params).context['page_obj']
+            found.extend(post.pk for post in page)
+            if not page.has_next():
+                break
+            params['cursor'] = page.next_cursor
+        self.assertEqual(sorted(found), [post.pk for post in posts])
+
+    @override_settings(NUMBER_OF_LINES_ON_PAGE=2)
+    def test_cursor_keeps_ranking(self):
+        """Новые посты не сдвигают выдачу: страницы идут по снимку."""
+        pks = [self.create_post('текст ' * (5 - i)).pk for i in range(4)]
+        first = search_posts('текст')
+        self.assertEqual([post.pk for post in first], pks[:2])
+        # этот пост занял бы первое место и сдвинул бы вторую страницу
+        self.create_post('текст ' * 10)
+        second = search_posts('текст', first.next_cursor)
+        self.assertEqual([post.pk for post in second], pks[2:])
+
+    @override_settings(NUMBER_OF_LINES_ON_PAGE=2)
+    def test_cursor_without_snapshot(self):
+        """Если снимок вытеснен из кеша, поиск считается заново."""
+        pks = [self.create_post('текст ' * (5 - i)).pk for i in range(4)]
+        first = search_posts('текст')
+        cache.clear()
+        second = search_posts('текст', first.next_cursor)
+        self.assertEqual([post.pk for post in second], pks[2:])
+
+    def test_admin_search(self):
+        """Поиск в админке идет по индексу."""
+        post = self.create_post('Пост про котов')
+        self.create_post('Пост про собак')
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin'
+        )
+        client = Client()
+        client.force_login(admin)
+        response = client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'кот'}
+        )
+        self.assertEqual(
+            [row.pk for row in response.context['cl'].result_list],
+            [post.pk]
+        )
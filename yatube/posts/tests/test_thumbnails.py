@@ -0,0 +1,211 @@
+import shutil
+import tempfile
+from concurrent.futures import Future
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from posts.models import Post, User
+from posts.thumbnails import post_thumbnails, posts_without_thumbnails
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class TestThumbnails(TestCase):
+    """Проверяем миниатюры картинок постов."""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.post = self.create_post()
+
+    def create_post(self) -> Post:
+        return Post.objects.create(
+            text='Пост',
+            author=self.author,
+            image=SimpleUploadedFile(
+                name='small.gif', content=SMALL_GIF, content_type='image/gif'
+            )
+        )
+
+    def thumbnail_file(self, geometry: str, **options) -> ImageFile:
+        backend = default.backend
+        source = ImageFile(self.post.image)
+        options = backend.prepare_options(source, options)
+        return ImageFile(
+            backend._get_thumbnail_filename(source, geometry, options),
+            default.storage
+        )
+
+    def test_request_does_not_generate(self):
+        """В запросе миниатюра не создается, до готовности - оригинал."""
+        template = Template(
+            '{% load thumbnail %}'
+            '{% thumbnail post.image "960x339" crop="center" upscale=True '
+            'as im %}{{ im.url }}{% endthumbnail %}'
+        )
+        context = Context({'post': self.post})
+        self.assertEqual(template.render(context), self.post.image.url)
+        thumbnail = self.thumbnail_file(
+            '960x339', crop='center', upscale=True
+        )
+        self.assertFalse(thumbnail.exists())
+
+        # воркер создал миниатюру и записал ее в хранилище sorl
+        thumbnail.set_size((960, 339))
+        default.kvstore.set(thumbnail)
+        self.assertEqual(template.render(context), thumbnail.url)
+
+    def test_batched_lookups(self):
+        """Миниатюры всех карточек страницы ищутся одним запросом."""
+        posts = [self.post, self.create_post(), self.create_post()]
+        template = Template(
+            '{% load post_cards %}{% prefetch_article_cards posts %}'
+            '{% for post in posts %}{% article_card post %}{% endfor %}'
+        )
+        with CaptureQueriesContext(connection) as queries:
+            content = template.render(Context({'posts': posts}))
+        kvstore_queries = [
+            query for query in queries.captured_queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+        self.assertEqual(len(kvstore_queries), 1)
+        for post in posts:
+            self.assertIn(post.image.url, content)
+
+    def store_thumbnails(self) -> None:
+        for width, geometry, options in post_thumbnails():
+            thumbnail = self.thumbnail_file(geometry, **options)
+            thumbnail.set_size((width, width // 3))
+            default.kvstore.set(thumbnail)
+
+    def test_command_skips_ready_posts(self):
+        """Команда ставит в очередь только посты без миниатюр."""
+        self.store_thumbnails()
+        # другое содержимое - другой файл, миниатюр у него нет
+        missing = Post.objects.create(
+            text='Пост',
+            author=self.author,
+            image=SimpleUploadedFile(
+                name='other.gif', content=SMALL_GIF + b'\0',
+                content_type='image/gif'
+            )
+        )
+        done = Future()
+        done.set_result(None)
+        out = StringIO()
+        with mock.patch(
+            'posts.management.commands.generate_thumbnails.'
+            'submit_thumbnails',
+            return_value=done
+        ) as submit:
+            call_command('generate_thumbnails', stdout=out)
+        submit.assert_called_once_with(missing.pk)
+        self.assertIn(
+            'Проверено постов: 2, созданы миниатюры: 1', out.getvalue()
+        )
+
+    def test_posts_without_thumbnails(self):
+        """Пост без любого из вариантов попадает в список, запрос один."""
+        other = self.create_post()
+        rows = [(self.post.pk, self.post.image.name)]
+        # та же картинка у другого поста - та же проверка
+        rows.append((other.pk, other.image.name))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(
+                posts_without_thumbnails(rows), [self.post.pk, other.pk]
+            )
+        self.assertEqual(len(queries), 1)
+
+        self.store_thumbnails()
+        _, geometry, options = post_thumbnails()[-1]
+        default.kvstore.delete(self.thumbnail_file(geometry, **options))
+        self.assertEqual(
+            posts_without_thumbnails(rows), [self.post.pk, other.pk]
+        )
+        self.store_thumbnails()
+        self.assertEqual(posts_without_thumbnails(rows), [])
+
+    @override_settings(POST_IMAGE_WIDTHS=(480, 960))
+    def test_srcset(self):
+        """Готовые варианты картинки попадают в srcset, WebP - в source."""
+        self.store_thumbnails()
+        template = Template(
+            '{% load post_cards %}{% prefetch_article_cards posts %}'
+            '{% for post in posts %}{% article_card post %}{% endfor %}'
+        )
+        content = template.render(Context({'posts': [self.post]}))
+        self.assertIn('<source type="image/webp"', content)
+        self.assertIn('.webp 480w', content)
+        self.assertIn('.jpg 960w', content)
+        self.assertIn('loading="lazy"', content)
+        self.assertNotIn(self.post.image.url, content)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class TestThumbnailScheduling(TransactionTestCase):
+    """Проверяем постановку миниатюр в очередь после коммита."""
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_scheduled_after_commit(self):
+        """Воркер получает пост только после коммита транзакции."""
+        author = User.objects.create_user(username='author')
+        with mock.patch('posts.thumbnails.submit_thumbnails') as submit:
+            with transaction.atomic():
+                post = Post.objects.create(
+                    text='Пост',
+                    author=author,
+                    image=SimpleUploadedFile(
+                        name='small.gif',
+                        content=SMALL_GIF,
+                        content_type='image/gif'
+                    )
+                )
+                submit.assert_not_called()
+            submit.assert_called_once_with(post.pk)
+
+            # откаченная транзакция ничего не ставит в очередь
+            submit.reset_mock()
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    post.image = SimpleUploadedFile(
+                        name='other.gif',
+                        content=SMALL_GIF + b'\0',
+                        content_type='image/gif'
+                    )
+                    post.save()
+                    raise RuntimeError
+            submit.assert_not_called()
@@ -1,5 +1,6 @@
 from http import HTTPStatus
 
+from django.core.cache import cache
 from django.test import Client, TestCase
 from django.urls import reverse
 
@@ -24,6 +25,9 @@ class TestUrl(TestCase):
         )
 
     def setUp(self) -> None:
+        # страницы кэшируются одни на всех, шаблоны видны только при
+        # первой отрисовке
+        cache.clear()
         self.guest_client = Client()
         self.auth_client = Client()
         self.auth_client.force_login(TestUrl.user)
@@ -52,6 +56,13 @@ class TestUrl(TestCase):
         response = self.guest_client.get('unexisting_page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
 
+    def test_404_comments_of_missing_post(self):
+        """Комментарии несуществующего поста - 404."""
+        response = self.guest_client.get(
+            f'/posts/{TestUrl.post.pk + 1}/comments/'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
     def test_availability_of_url_with_changeable_data(self):
         """Проверка доступности для страниц с изменяемыми данными."""
         post_urls = {
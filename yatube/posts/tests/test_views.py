@@ -1,16 +1,27 @@
+import hashlib
 import shutil
 import tempfile
+import time
 
 from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.paginator import Page
-from django.test import Client, TestCase, override_settings
+from django.db import connection
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django import forms
 
+from core.cache import (LEASE_KEY, cache_page_swr, invalidate_tags,
+                        page_cache_key, read_tagged, set_tagged,
+                        tag_request)
 from posts.forms import PostForm
-from posts.models import Follow, Group, Post, User
+from posts.models import Comment, Follow, Group, Post, User
+from posts.paginators import feed_count_key
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -291,6 +302,121 @@ class TestView(TestCase):
                         count_post_in_page
                     )
 
+    @override_settings(COMMENTS_PER_PAGE=5)
+    def test_comments_page(self):
+        """Комментарии идут страницами, авторы - в том же запросе."""
+        authors = [
+            User.objects.create_user(username=f'reader{i}') for i in range(3)
+        ]
+        Comment.objects.bulk_create([
+            Comment(
+                post=self.post, author=authors[i % 3], text=f'Комментарий {i}'
+            ) for i in range(7)
+        ])
+        expected = list(
+            self.post.comments.order_by('-created', '-pk').values_list(
+                'text', flat=True
+            )
+        )
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        comment_queries = [
+            query for query in queries.captured_queries
+            if 'posts_comment' in query['sql']
+        ]
+        self.assertEqual(len(comment_queries), 1)
+        comments = response.context['comments']
+        self.assertEqual([comment.text for comment in comments], expected[:5])
+        self.assertTrue(comments.has_next())
+
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            {'cursor': comments.next_cursor}
+        )
+        self.assertTemplateNotUsed(response, 'base.html')
+        older = response.context['comments']
+        self.assertEqual([comment.text for comment in older], expected[5:])
+        self.assertFalse(older.has_next())
+
+    def test_cursor_paginator(self):
+        """Проверим переходы по курсорам вперед и назад."""
+        Post.objects.all().delete()
+        count_objects = settings.NUMBER_OF_LINES_ON_PAGE * 2 + 3
+        Post.objects.bulk_create(
+            [
+                Post(
+                    text='Пост № ' + str(i + 1),
+                    author=self.user_pshk,
+                    group=self.group1
+                ) for i in range(count_objects)
+            ]
+        )
+        expected = list(Post.objects.order_by('-pub_date', '-pk'))
+        url = reverse('posts:index')
+
+        first = self.author_client.get(url).context['page_obj']
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+        self.assertEqual(
+            list(first), expected[:settings.NUMBER_OF_LINES_ON_PAGE]
+        )
+
+        second = self.author_client.get(
+            url, {'cursor': first.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(
+            list(second),
+            expected[settings.NUMBER_OF_LINES_ON_PAGE:
+                     settings.NUMBER_OF_LINES_ON_PAGE * 2]
+        )
+
+        cache.clear()
+        last = self.author_client.get(
+            url, {'cursor': second.next_cursor}
+        ).context['page_obj']
+        self.assertFalse(last.has_next())
+        self.assertEqual(len(last), 3)
+
+        cache.clear()
+        back = self.author_client.get(
+            url, {'cursor': last.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(back), list(second))
+
+        cache.clear()
+        broken = self.author_client.get(
+            url, {'cursor': 'broken'}
+        ).context['page_obj']
+        self.assertEqual(list(broken), list(first))
+
+    @override_settings(PAGINATOR_WINDOW=5)
+    def test_paginator_window_and_cached_count(self):
+        """Ссылки на страницы ограничены окном, число постов в кэше."""
+        Post.objects.bulk_create(
+            [
+                Post(text='Пост', author=self.user_pshk, group=self.group1)
+                for _ in range(settings.NUMBER_OF_LINES_ON_PAGE * 10)
+            ]
+        )
+        url = reverse('posts:group_list', kwargs={'slug': self.group1.slug})
+        windows = ((1, range(1, 6)), (6, range(4, 9)), (11, range(7, 12)))
+        for number, window in windows:
+            with self.subTest(page=number):
+                page = self.author_client.get(
+                    url, {'page': number}
+                ).context['page_obj']
+                self.assertEqual(page.page_window, window)
+
+        # счетчик взят из кэша и сброшен новым постом группы
+        key = feed_count_key(f'group:{self.group1.pk}')
+        self.assertEqual(cache.get(key), Post.objects.count())
+        Post.objects.create(
+            text='Новый', author=self.user_pshk, group=self.group1
+        )
+        self.assertIsNone(cache.get(key))
+
     def test_for_not_posting_in_another_group(self):
         """Проверим что при наличии нескольких групп.
 
@@ -409,13 +535,17 @@ class TestView(TestCase):
             ),
         )
 
+        digest = hashlib.sha256(small_gif).hexdigest()
         for url, elem in urls:
             with self.subTest(url=url):
                 response = self.author_client.get(url)
                 obj = response.context.get(elem)
                 if elem == 'page_obj':
                     obj = obj.object_list[0]
-                self.assertEqual(obj.image.name, f'posts/{upload_image.name}')
+                self.assertEqual(
+                    obj.image.name,
+                    f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'
+                )
 
     def test_authorized_user_can_subscribe_and_unsubscribe(self):
         """Провери возможность подписки/отписки"""
@@ -495,9 +625,195 @@ class TestView(TestCase):
         )
 
         response_before = self.author_client.get(reverse('posts:index'))
+        # изменение в обход сигналов не сбрасывает кэш
+        Post.objects.filter(pk=post.pk).update(text='Изменен')
+        response_cached = self.author_client.get(reverse('posts:index'))
+        self.assertEqual(response_before.content, response_cached.content)
+
+        # удаление поста сбрасывает закэшированную страницу
         post.delete()
         response_after = self.author_client.get(reverse('posts:index'))
-        self.assertEqual(response_before.content, response_after.content)
-        cache.clear()
-        response_last = self.author_client.get(reverse('posts:index'))
-        self.assertNotEqual(response_after.content, response_last)
+        self.assertNotEqual(response_before.content, response_after.content)
+        self.assertNotContains(response_after, 'Пост 2')
+
+    def test_group_slug_change_resets_cache(self):
+        """После смены slug старый адрес группы перестает отвечать."""
+        group = Group.objects.get(pk=self.group1.pk)
+        old_url = reverse('posts:group_list', kwargs={'slug': group.slug})
+        new_url = reverse('posts:group_list', kwargs={'slug': 'renamed'})
+        self.assertEqual(self.client.get(old_url).status_code, 200)
+        self.assertEqual(self.client.get(new_url).status_code, 404)
+
+        group.slug = 'renamed'
+        group.save()
+        self.assertEqual(self.client.get(old_url).status_code, 404)
+        self.assertEqual(self.client.get(new_url).status_code, 200)
+
+    def test_article_cards_cache(self):
+        """Карточка поста берется из кэша до правки поста."""
+        template = Template(
+            '{% load post_cards %}{% prefetch_article_cards posts %}'
+            '{% for post in posts %}{% article_card post %}{% endfor %}'
+        )
+        template.render(Context({'posts': [self.post]}))
+
+        # изменение без обновления updated_at не видно - карточка в кэше
+        Post.objects.filter(pk=self.post.pk).update(text='Тихая правка')
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertIn(
+            'Пост 1', template.render(Context({'posts': [post]}))
+        )
+
+        # правка через форму меняет ключ карточки
+        self.author_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            {'text': 'Правка автора', 'group': self.group1.pk}
+        )
+        post.refresh_from_db()
+        html = template.render(Context({'posts': [post]}))
+        self.assertIn('Правка автора', html)
+
+        # переименование автора тоже меняет ключ
+        User.objects.filter(pk=post.author_id).update(first_name='Новое')
+        post = Post.objects.select_related('author', 'group').get(pk=post.pk)
+        html = template.render(Context({'posts': [post]}))
+        self.assertIn('Новое', html)
+
+    def test_cache_is_keyed_by_page(self):
+        """Разные страницы ленты кэшируются отдельно."""
+        Post.objects.bulk_create(
+            [
+                Post(text=f'Пост № {i}', author=self.user_pshk)
+                for i in range(settings.NUMBER_OF_LINES_ON_PAGE)
+            ]
+        )
+        first = self.author_client.get(reverse('posts:index'))
+        second = self.author_client.get(
+            reverse('posts:index'),
+            {'cursor': first.context['page_obj'].next_cursor}
+        )
+        self.assertNotEqual(first.content, second.content)
+
+    def test_cache_lease(self):
+        """Пока страницу пересчитывают, отдается устаревшая копия."""
+        url = reverse('posts:index')
+        response_before = self.author_client.get(url)
+        Post.objects.create(text='Новый пост', author=self.user_pshk)
+
+        request = RequestFactory().get(url)
+        request.user = self.user_pshk
+        lease_key = LEASE_KEY.format(page_cache_key(request))
+        cache.add(lease_key, 'другой запрос', 30)
+        response_stale = self.author_client.get(url)
+        self.assertEqual(response_before.content, response_stale.content)
+
+        cache.delete(lease_key)
+        self.assertContains(self.author_client.get(url), 'Новый пост')
+
+    def test_cache_early_expiration(self):
+        """Долго считавшаяся запись истекает раньше срока."""
+        set_tagged('early', 'value', {}, timeout=10, delta=10 ** 6)
+        with override_settings(PAGE_CACHE_EARLY_BETA=0):
+            self.assertEqual(read_tagged('early'), ('value', True))
+        self.assertEqual(read_tagged('early'), ('value', False))
+
+    def test_stale_while_revalidate(self):
+        """После срока страница отдается из кэша и пересчитывается в фоне."""
+        renders = []
+
+        @cache_page_swr(timeout=60, stale_timeout=60)
+        def view(request):
+            tag_request(request, 'swr')
+            renders.append(request)
+            return HttpResponse(str(len(renders)))
+
+        request = RequestFactory().get('/swr/?page=2', secure=True)
+        request.user = AnonymousUser()
+        key = page_cache_key(request)
+        self.assertEqual(view(request).content, b'1')
+
+        # срок прошел, но страница еще в кэше
+        versions, response, _, delta = cache.get(key)
+        cache.set(key, (versions, response, 0, delta))
+        self.assertEqual(view(request).content, b'1')
+        deadline = time.monotonic() + 5
+        while not read_tagged(key)[1] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(view(request).content, b'2')
+        # в фоне страница считается по отдельному анонимному запросу
+        background = renders[1]
+        self.assertIsNot(background, request)
+        self.assertEqual(
+            background.build_absolute_uri(), request.build_absolute_uri()
+        )
+        self.assertEqual(background.GET['page'], '2')
+        self.assertEqual(page_cache_key(background), key)
+        self.assertFalse(background.user.is_authenticated)
+
+        # после сброса тегов запрос ждет пересчета
+        invalidate_tags('swr')
+        self.assertEqual(view(request).content, b'3')
+
+    def test_personal_holes(self):
+        """Общая страница дорисовывается для каждого пользователя."""
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.user_pshk)
+        reader_client = Client()
+        reader_client.force_login(reader)
+        profile = reverse('posts:profile', kwargs={'username': 'pshk'})
+        detail = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )
+
+        # первым страницы рисует автор, остальные получают их из кэша
+        author_profile = self.author_client.get(profile)
+        author_detail = self.author_client.get(detail)
+        self.assertContains(author_profile, 'Пользователь: pshk')
+        self.assertContains(author_detail, 'Изменить пост')
+
+        with self.assertNumQueries(3):
+            # сессия, пользователь и проверка подписки
+            reader_profile = reader_client.get(profile)
+        self.assertTemplateNotUsed(reader_profile, 'posts/profile.html')
+        self.assertContains(reader_profile, 'Пользователь: reader')
+        self.assertContains(reader_profile, 'Отписаться')
+        self.assertNotEqual(reader_profile['ETag'], author_profile['ETag'])
+
+        reader_detail = reader_client.get(detail)
+        self.assertNotContains(reader_detail, 'Изменить пост')
+        self.assertContains(reader_detail, 'Добавить комментарий')
+
+        guest_detail = Client().get(detail)
+        self.assertContains(guest_detail, 'Войти')
+        self.assertNotContains(guest_detail, 'Добавить комментарий')
+
+    def test_conditional_get(self):
+        """Неизмененная страница отдается как 304 без шаблонов."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group1.slug}),
+            reverse('posts:profile', kwargs={'username': 'pshk'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        clients = (Client(), self.author_client)
+        for client in clients:
+            for url in urls:
+                with self.subTest(url=url):
+                    etag = client.get(url)['ETag']
+                    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code, 304)
+                    self.assertFalse(response.templates)
+
+        etags = {url: self.author_client.get(url)['ETag'] for url in urls}
+        Comment.objects.create(
+            post=self.post, author=self.user_pshk, text='Комментарий'
+        )
+        Post.objects.create(
+            text='Новый пост', author=self.user_pshk, group=self.group1
+        )
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.author_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200)
@@ -0,0 +1,233 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+from django.conf import settings
+from django.db import connections, transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# пропорции картинки поста в вёрстке
+IMAGE_ASPECT = 960 / 339
+IMAGE_OPTIONS = {'crop': 'center', 'upscale': True}
+# ширина картинки в вёрстке для атрибута sizes
+IMAGE_SIZES = '(max-width: 960px) 100vw, 960px'
+
+
+class ImageVariants(NamedTuple):
+    """Что нужно шаблону для <picture> с srcset."""
+
+    src: str
+    srcset: str
+    webp_srcset: str
+    sizes: str = IMAGE_SIZES
+
+
+def post_thumbnails() -> List[Tuple[int, str, dict]]:
+    """Варианты картинки поста: ширина, геометрия и параметры sorl.
+
+    Для каждой ширины из POST_IMAGE_WIDTHS создаются JPEG и WebP.
+    """
+    variants = []
+    for width in settings.POST_IMAGE_WIDTHS:
+        geometry = f'{width}x{round(width / IMAGE_ASPECT)}'
+        variants.append((width, geometry, IMAGE_OPTIONS))
+        variants.append(
+            (width, geometry, {**IMAGE_OPTIONS, 'format': 'WEBP'})
+        )
+    return variants
+
+
+_state = threading.local()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails'
+            )
+        return _executor
+
+
+class DeferredThumbnailBackend(ThumbnailBackend):
+    """Во время запроса только ищет готовую миниатюру.
+
+    Миниатюры создает фоновый воркер (generate_thumbnails), а пока
+    миниатюры нет, тег thumbnail получает оригинал картинки.
+    """
+
+    def prepare_options(self, source: ImageFile, options: dict) -> dict:
+        # те же умолчания, что в ThumbnailBackend.get_thumbnail, от них
+        # зависит имя файла миниатюры
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return options
+
+    def thumbnail_file(self, source: ImageFile, geometry_string: str,
+                       options: dict) -> ImageFile:
+        options = self.prepare_options(source, dict(options))
+        return ImageFile(
+            self._get_thumbnail_filename(source, geometry_string, options),
+            default.storage
+        )
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not file_ or getattr(_state, 'generating', False):
+            return super().get_thumbnail(file_, geometry_string, **options)
+        source = ImageFile(file_)
+        thumbnail = self.thumbnail_file(source, geometry_string, options)
+        return default.kvstore.get(thumbnail) or source
+
+
+def load_stored(image_files: Iterable[ImageFile]) -> Dict[str, ImageFile]:
+    """Записи хранилища sorl для нескольких файлов сразу.
+
+    Для cached_db_kvstore это один get_many к кэшу и один запрос к БД
+    на промахи, как в KVStore._get_raw, только для всех ключей вместе.
+    """
+    kvstore = default.kvstore
+    empty = cached_db_kvstore.EMPTY_VALUE
+    if not isinstance(kvstore, cached_db_kvstore.KVStore):
+        stored = {image.key: kvstore.get(image) for image in image_files}
+        return {key: image for key, image in stored.items() if image}
+
+    keys = {add_prefix(image.key): image.key for image in image_files}
+    values = kvstore.cache.get_many(keys)
+    missing = keys.keys() - values.keys()
+    if missing:
+        found = dict(
+            KVStoreModel.objects.filter(key__in=missing).values_list(
+                'key', 'value'
+            )
+        )
+        # отсутствие записи тоже кэшируется, чтобы не ходить в БД
+        kvstore.cache.set_many(
+            {key: found.get(key, empty) for key in missing},
+            sorl_settings.THUMBNAIL_CACHE_TIMEOUT
+        )
+        values.update(found)
+    return {
+        keys[key]: deserialize_image_file(value)
+        for key, value in values.items() if value != empty
+    }
+
+
+def thumbnail_files(source: ImageFile) -> List[Tuple[int, dict, ImageFile]]:
+    """Файлы всех вариантов картинки, созданы они или еще нет."""
+    backend = DeferredThumbnailBackend()
+    return [
+        (width, options, backend.thumbnail_file(source, geometry, options))
+        for width, geometry, options in post_thumbnails()
+    ]
+
+
+def posts_without_thumbnails(rows: Iterable[Tuple[int, str]]) -> List[int]:
+    """id постов, у картинок которых готовы не все варианты.
+
+    rows - пары (id поста, имя картинки); хранилище sorl проверяется
+    одним запросом на все посты.
+    """
+    storage = Post._meta.get_field('image').storage
+    variants = {
+        pk: thumbnail_files(ImageFile(name, storage)) for pk, name in rows
+    }
+    stored = load_stored(
+        thumbnail
+        for files in variants.values()
+        for _, _, thumbnail in files
+    )
+    return [
+        pk for pk, files in variants.items()
+        if any(thumbnail.key not in stored for _, _, thumbnail in files)
+    ]
+
+
+def get_image_variants(files) -> Dict[str, ImageVariants]:
+    """Готовые варианты картинок, ключ - имя картинки.
+
+    Варианты всех картинок ищутся одним запросом к хранилищу sorl. Пока
+    вариантов нет, показывается оригинал.
+    """
+    thumbnails = {}
+    for file_ in files:
+        if file_:
+            source = ImageFile(file_)
+            thumbnails[file_.name] = (source, thumbnail_files(source))
+    if not thumbnails:
+        return {}
+    stored = load_stored(
+        thumbnail
+        for _, variants in thumbnails.values()
+        for _, _, thumbnail in variants
+    )
+
+    images = {}
+    for name, (source, variants) in thumbnails.items():
+        srcset = {'JPEG': [], 'WEBP': []}
+        # src - самый широкий готовый JPEG, пока его нет - оригинал
+        src, src_width = source.url, 0
+        for width, options, thumbnail in variants:
+            if thumbnail.key not in stored:
+                continue
+            image_format = options.get('format', 'JPEG')
+            url = stored[thumbnail.key].url
+            srcset[image_format].append(f'{url} {width}w')
+            if image_format == 'JPEG' and width > src_width:
+                src, src_width = url, width
+        images[name] = ImageVariants(
+            src=src,
+            srcset=', '.join(srcset['JPEG']),
+            webp_srcset=', '.join(srcset['WEBP'])
+        )
+    return images
+
+
+def generate_thumbnails(post_id: int) -> None:
+    """Создает миниатюры поста и сбрасывает страницы с оригиналом."""
+    _state.generating = True
+    try:
+        post = Post.objects.filter(pk=post_id).first()
+        if post is None or not post.image:
+            return
+        for _, geometry, options in post_thumbnails():
+            default.backend.get_thumbnail(post.image, geometry, **options)
+        # новое время изменения меняет ключ карточки поста, а сигнал
+        # сбрасывает страницы
+        post.save(update_fields=['updated_at'])
+    except Exception:
+        logger.exception('Не удалось создать миниатюры поста %s', post_id)
+    finally:
+        _state.generating = False
+        connections.close_all()
+
+
+def submit_thumbnails(post_id: int) -> Future:
+    """Ставит создание миниатюр в очередь фонового воркера."""
+    return get_executor().submit(generate_thumbnails, post_id)
+
+
+def schedule_thumbnails(post_id: int) -> None:
+    """Ставит создание миниатюр в очередь после коммита транзакции."""
+    transaction.on_commit(lambda: submit_thumbnails(post_id))
@@ -1,9 +1,43 @@
 from django.conf import settings
-from django.core.paginator import Page, Paginator
+from django.core.paginator import Page
+from django.db.models import QuerySet
 from django.http import HttpRequest
 
+from .models import Comment
+from .paginators import (
+    CachedCountPaginator, CommentPaginator, CursorPage, CursorPaginator
+)
 
-def get_page_obj(request: HttpRequest, list_object: list) -> Page:
-    paginator = Paginator(list_object, settings.NUMBER_OF_LINES_ON_PAGE)
+
+def get_page_obj(
+    request: HttpRequest,
+    list_object: QuerySet,
+    paginator_class=CursorPaginator,
+    feed: str = None
+) -> Page:
+    # старые ссылки вида ?page=N продолжают работать через OFFSET
     page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    if page_number is not None and paginator_class.allow_offset:
+        paginator = CachedCountPaginator(
+            list_object, settings.NUMBER_OF_LINES_ON_PAGE, feed=feed
+        )
+        page = paginator.get_page(page_number)
+        page.object_list = paginator_class.prepare_rows(page.object_list)
+        return page
+
+    paginator = paginator_class(
+        list_object, settings.NUMBER_OF_LINES_ON_PAGE
+    )
+    return paginator.get_page(request.GET.get('cursor'))
+
+
+def get_comments_page(request: HttpRequest, post_id: int) -> CursorPage:
+    # автор нужен шаблону только для имени, поэтому присоединяется
+    # к тому же запросу
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author'
+    ).only('post_id', 'text', 'created', 'author__username').order_by(
+        '-created', '-pk'
+    )
+    paginator = CommentPaginator(comments, settings.COMMENTS_PER_PAGE)
+    return paginator.get_page(request.GET.get('cursor'))
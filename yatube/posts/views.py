@@ -1,62 +1,106 @@
 from django.contrib.auth.decorators import login_required
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
+from core.cache import cache_page_swr, cache_page_tagged, tag_request
+from core.query_budget import query_budget
+
+from .feeds import get_follow_feed
 from .forms import CommentForm, PostForm
 from .models import Comment, Follow, Group, Post, User
-from .utils import get_page_obj
+from .search import search_posts
+from .utils import get_comments_page, get_page_obj
 
 
-@cache_page(20)
+@query_budget(3)
+@cache_page_swr()
 def index(request: HttpRequest) -> HttpResponse:
+    tag_request(request, 'feed:index')
     post_list = Post.objects.select_related('author', 'group').all()
     context = {
-        'page_obj': get_page_obj(request, post_list),
+        'page_obj': get_page_obj(request, post_list, feed='index'),
     }
     return render(request, 'posts/index.html', context)
 
 
+@query_budget(4)
+@cache_page_swr()
 def group_posts(request: HttpRequest, slug: str) -> HttpResponse:
+    tag_request(request, f'group-slug:{slug}')
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
+    tag_request(request, f'group:{group.pk}')
+    post_list = group.posts.select_related('author', 'group')
     context = {
         'group': group,
-        'page_obj': get_page_obj(request, post_list),
+        'page_obj': get_page_obj(
+            request, post_list, feed=f'group:{group.pk}'
+        ),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@query_budget(5)
+@cache_page_tagged()
 def profile(request: HttpRequest, username: str) -> HttpResponse:
-    user = get_object_or_404(User, username=username)
-    post_list = Post.objects.filter(
-        author=user).prefetch_related('author', 'group').all()
-    if not request.user.is_anonymous:
-        following = user.following.filter(user=request.user).exists()
-    else:
-        following = False
-
+    tag_request(request, f'profile:{username}')
+    user = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    tag_request(request, f'author:{user.pk}')
+    post_list = Post.objects.filter(author=user).select_related(
+        'author', 'group'
+    )
     context = {
         'author': user,
-        'page_obj': get_page_obj(request, post_list),
-        'following': following
+        'page_obj': get_page_obj(
+            request, post_list, feed=f'author:{user.pk}'
+        ),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@query_budget(4)
+@cache_page_tagged()
 def post_detail(request: HttpRequest, post_id: int) -> HttpResponse:
-    post = get_object_or_404(Post, pk=post_id)
-    form = CommentForm(request.POST or None)
-
-    comments = post.comments.all()
+    tag_request(request, f'post:{post_id}')
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id
+    )
+    tag_request(request, f'author:{post.author_id}')
+    if post.group_id is not None:
+        tag_request(request, f'group:{post.group_id}')
     context = {
         'post': post,
-        'form': form,
-        'comments': comments
+        'comments': get_comments_page(request, post.pk),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@query_budget(4)
+@cache_page_tagged()
+def post_comments(request: HttpRequest, post_id: int) -> HttpResponse:
+    # фрагмент с более старыми комментариями для кнопки "Показать еще"
+    tag_request(request, f'post:{post_id}')
+    # как post_detail: для несуществующего поста - 404, а не пустой список
+    get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    context = {
+        'post_id': post_id,
+        'comments': get_comments_page(request, post_id),
+    }
+    return render(request, 'includes/comment_list.html', context)
+
+
+@query_budget(4)
+def search(request: HttpRequest) -> HttpResponse:
+    query = request.GET.get('q', '').strip()
+    context = {
+        'query': query,
+        'page_obj': search_posts(query, request.GET.get('cursor')),
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@query_budget(6)
 @login_required
 def post_create(request: HttpRequest) -> HttpResponse:
     form = PostForm(
@@ -75,6 +119,7 @@ def post_create(request: HttpRequest) -> HttpResponse:
     return render(request, 'posts/create_post.html', context)
 
 
+@query_budget(9)
 @login_required
 def post_edit(request: HttpRequest, post_id: int) -> HttpResponse:
     post = get_object_or_404(Post, pk=post_id)
@@ -98,6 +143,7 @@ def post_edit(request: HttpRequest, post_id: int) -> HttpResponse:
     return render(request, 'posts/create_post.html', context)
 
 
+@query_budget(5)
 @login_required
 def add_comment(request: HttpRequest, post_id: int):
     post = get_object_or_404(Post, pk=post_id)
@@ -111,28 +157,27 @@ def add_comment(request: HttpRequest, post_id: int):
         return redirect('posts:post_detail', post_id=post_id)
 
 
+@query_budget(3)
 @login_required
 def follow_index(request: HttpRequest):
-    author_list = [follow.author for follow in request.user.follower.all()]
-
-    post_list = Post.objects.select_related(
-        'author', 'group').filter(author__in=author_list)
+    feed, paginator_class = get_follow_feed(request.user)
     context = {
-        'page_obj': get_page_obj(request, post_list),
+        'page_obj': get_page_obj(request, feed, paginator_class),
     }
     return render(request, 'posts/follow.html', context)
 
 
+@query_budget(11)
 @login_required
 def profile_follow(request: HttpRequest, username: str):
     # Подписаться на автора
     author = get_object_or_404(User, username=username)
-    is_signed = request.user.follower.filter(author=author).exists()
-    if username != request.user.username and not is_signed:
-        Follow.objects.create(user=request.user, author=author)
+    if username != request.user.username:
+        Follow.objects.get_or_create(user=request.user, author=author)
     return redirect('posts:profile', username=username)
 
 
+@query_budget(8)
 @login_required
 def profile_unfollow(request: HttpRequest, username: str):
     # Дизлайк, отписка
@@ -6,6 +6,8 @@ from django.contrib.auth.views import PasswordResetDoneView
 from django.contrib.auth.views import PasswordResetView
 from django.urls import path, reverse_lazy
 
+from core.query_budget import query_budget
+
 from . import views
 
 app_name = 'users'
@@ -15,42 +17,46 @@ urlpatterns = [
     path('signup/', views.SignUp.as_view(), name='signup'),
     path(
         'logout/',
-        LogoutView.as_view(template_name='users/logged_out.html'),
+        query_budget(4)(
+            LogoutView.as_view(template_name='users/logged_out.html')
+        ),
         name='logout'
     ),
     path(
         'login/',
-        LoginView.as_view(template_name='users/login.html'),
+        query_budget(2)(
+            LoginView.as_view(template_name='users/login.html')
+        ),
         name='login'
     ),
     path(
         'password_reset_form/',
-        PasswordResetView.as_view(
+        query_budget(2)(PasswordResetView.as_view(
             template_name='users/password_reset_form.html',
             success_url=reverse_lazy('auth:password_reset_done')
-        ),
+        )),
         name='password_reset_form'
     ),
     path(
         'password_reset/done/',
-        PasswordResetDoneView.as_view(
+        query_budget(2)(PasswordResetDoneView.as_view(
             template_name='users/password_reset_complete.html',
-        ),
+        )),
         name='password_reset_done'
     ),
     path(
         'password_change/',
-        PasswordChangeView.as_view(
+        query_budget(2)(PasswordChangeView.as_view(
             template_name='users/password_change.html',
             success_url=reverse_lazy('auth:password_change_done'),
-        ),
+        )),
         name='password_change',
     ),
     path(
         'password_change_done/',
-        PasswordChangeDoneView.as_view(
+        query_budget(2)(PasswordChangeDoneView.as_view(
             template_name='users/password_change_done.html',
-        ),
+        )),
         name='password_change_done'
     ),
 ]
@@ -8,3 +8,4 @@ class SignUp(CreateView):
     form_class = CreationForm
     success_url = reverse_lazy('post:index')
     template_name = 'users/signup.html'
+    query_budget = 2
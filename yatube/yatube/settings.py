@@ -38,6 +38,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.query_budget.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -85,10 +86,21 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# L1 в памяти процесса перед общим кэшем 'shared'; в бою 'shared' -
+# memcached (django.core.cache.backends.memcached.PyLibMCCache или
+# MemcachedCache) либо FileBasedCache, LocMemCache - локальная замена
 CACHES = {
     'default': {
+        'BACKEND': 'core.cache_backends.TwoTierCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 60,
+        },
+    },
+    'shared': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
 }
 
 LANGUAGE_CODE = 'ru'
@@ -115,6 +127,64 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 NUMBER_OF_LINES_ON_PAGE = 10
 
+# что делать, если view сделал больше запросов к БД, чем заявил в
+# query_budget: 'raise', 'warn' или 'off'
+QUERY_BUDGET_MODE = 'warn'
+
+# сколько комментариев показывать на странице поста и во фрагменте
+COMMENTS_PER_PAGE = 20
+
+# сколько номеров страниц показывать вокруг текущей
+PAGINATOR_WINDOW = 5
+
+# по сколько постов обрабатывать за раз в массовых действиях админки
+MODERATION_BATCH_SIZE = 500
+
+# до скольки строк считать отфильтрованный список постов в админке
+ADMIN_COUNT_LIMIT = 10000
+
+# сколько хранить в кэше число постов ленты для нумерации страниц
+FEED_COUNT_TIMEOUT = 60 * 60
+
+# страницы сбрасываются по тегам при изменении данных, поэтому
+# время жизни можно держать большим
+PAGE_CACHE_TIMEOUT = 60 * 60 * 6
+
+# устаревшую страницу пересчитывает один запрос, остальные отдают старую
+# копию или ждут до PAGE_CACHE_LEASE_WAIT секунд; 0 отключает блокировку
+PAGE_CACHE_LEASE_TIMEOUT = 30
+PAGE_CACHE_LEASE_WAIT = 2
+
+# сколько после PAGE_CACHE_TIMEOUT отдавать страницы с cache_page_swr,
+# пока они пересчитываются в фоне
+PAGE_CACHE_STALE_TIMEOUT = 60 * 60
+
+# коэффициент вероятностного раннего истечения, 0 - без него
+PAGE_CACHE_EARLY_BETA = 1.0
+
+# карточки постов версионируются временем изменения поста
+ARTICLE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# push - посты раскладываются по лентам подписчиков при публикации,
+# hybrid - посты авторов с числом подписчиков от FEED_CELEBRITY_THRESHOLD
+# не раскладываются, а подмешиваются в ленту при чтении,
+# merge - лента собирается слиянием последних постов авторов из кэша
+FOLLOW_FEED_MODE = 'push'
+
+FEED_CELEBRITY_THRESHOLD = 10000
+
+# сколько последних постов автора держать в кэше для режима merge
+FEED_RING_SIZE = 200
+
+# миниатюры создаются в фоне после сохранения поста, до этого в
+# шаблонах показывается оригинал
+THUMBNAIL_BACKEND = 'posts.thumbnails.DeferredThumbnailBackend'
+
+THUMBNAIL_WORKERS = 2
+
+# ширины вариантов картинки поста для srcset, к каждому создается WebP
+POST_IMAGE_WIDTHS = (480, 960)
+
 MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')